@@ -0,0 +1,181 @@
+"""
+This is the entry file to the CPU emulator.
+Usage: $py CPUEmulator.py <prog>.hack|<prog>.bin [-n cycles] [--set R0=3 ...] [--dump 0:3]
+    [--jit | --compare | --batch inputs.csv | --profile profile.json]
+"""
+
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+from emulator import HackComputer
+from hack_file import load_rom
+from jit import JitHackComputer
+from profiler import ProfilingHackComputer
+from rom_map import MAP_SUFFIX, RomMap
+
+
+_PROFILE_TOP = 10
+"""Number of regions printed after a profiled run."""
+
+
+def _parse_assignment(text: str) -> tuple[int, int]:
+    """Convert `address=value` into a pair of ints. Rn names are allowed."""
+    address, value = text.split("=")
+    address = address.upper()
+    return int(address[1:] if address.startswith("R") else address), int(value)
+
+
+def _parse_range(text: str) -> range:
+    """Convert `start[:end]` into a range of RAM addresses."""
+    start, _, end = text.partition(":")
+    return range(int(start), int(end or start) + 1)
+
+
+def _timed_run(computer: HackComputer, args) -> float:
+    """Initialize RAM, run the program and return the elapsed seconds."""
+    for address, value in args.set:
+        computer.ram[address] = value & 0xFFFF
+    start = time.perf_counter()
+    computer.run(args.cycles)
+    return time.perf_counter() - start
+
+
+def _report(name: str, computer: HackComputer, elapsed: float) -> None:
+    """Print the outcome of a run and its speed."""
+    status = "halted" if computer.halted else "stopped"
+    cycles = computer.cycles
+    print(f"{name}: {status} after {cycles} cycles in {elapsed:.3f}s", end="")
+    print(f" ({cycles / elapsed / 1e6:.2f} MIPS)" if elapsed else "")
+
+
+def _run_batch(rom, args) -> None:
+    """Run one lane per row of the inputs CSV and print the results as CSV.
+
+    The header row of the inputs names the RAM addresses that each following
+    row initializes, e.g. `R0,R1`.
+    """
+    from batch_emulator import BatchHackComputer  # Needs NumPy
+
+    with open(args.batch, newline="", encoding="utf-8") as f:
+        header, *rows = list(csv.reader(f))
+    addresses = [_parse_assignment(f"{name}=0")[0] for name in header]
+    computer = BatchHackComputer(rom, len(rows))
+    for column, address in enumerate(addresses):
+        computer.ram[:, address] = [int(row[column]) & 0xFFFF for row in rows]
+    start = time.perf_counter()
+    steps = computer.run(args.cycles)
+    elapsed = time.perf_counter() - start
+    print(f"{len(rows)} lanes: {steps} steps in {elapsed:.3f}s")
+
+    dumped = [address for addresses in args.dump for address in addresses]
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["lane", "halted", "cycles", *(f"RAM[{a}]" for a in dumped)])
+    for lane in range(len(rows)):
+        writer.writerow(
+            [
+                lane,
+                int(computer.halted[lane]),
+                computer.cycles[lane],
+                *(computer.ram[lane, address] for address in dumped),
+            ]
+        )
+
+
+def _run_profiled(rom, args) -> ProfilingHackComputer:
+    """Run the program with a profiler, write the profile and print its top
+    regions.
+
+    The labels and `.asm` lines come from the `Prog.hack.map` written by
+    `HackAssembler.py --map`, if there is one.
+    """
+    map_path = Path(args.hack_path).with_suffix(MAP_SUFFIX)
+    rom_map = RomMap.read(map_path) if map_path.exists() else None
+    computer = ProfilingHackComputer(rom, rom_map and rom_map.labels)
+    elapsed = _timed_run(computer, args)
+    _report("profiler", computer, elapsed)
+    profile = computer.write_profile(args.profile, rom_map and rom_map.asm_lines)
+    print(f"{'region':<32} {'cycles':>12} {'%':>6} {'calls':>9}")
+    for entry in profile["flat"][:_PROFILE_TOP]:
+        print(
+            f"{entry['region']:<32} {entry['cycles']:>12} "
+            f"{entry['percent']:>6.2f} {entry['calls']:>9}"
+        )
+    return computer
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description="Run a Hack program.")
+    arg_parser.add_argument("hack_path", help="a .hack or packed .bin file")
+    arg_parser.add_argument(
+        "-n",
+        "--cycles",
+        type=int,
+        default=10_000_000,
+        help="maximum number of instructions to execute",
+    )
+    arg_parser.add_argument(
+        "--set",
+        type=_parse_assignment,
+        action="append",
+        default=[],
+        metavar="ADDR=VALUE",
+        help="initialize a RAM word, e.g. R0=3 or 16384=-1",
+    )
+    arg_parser.add_argument(
+        "--dump",
+        type=_parse_range,
+        action="append",
+        default=[],
+        metavar="START[:END]",
+        help="print RAM words after the run",
+    )
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--jit",
+        action="store_true",
+        help="execute compiled basic blocks instead of single instructions",
+    )
+    mode.add_argument(
+        "--compare",
+        action="store_true",
+        help="run in both modes, check the results match and report the speedup",
+    )
+    mode.add_argument(
+        "--batch",
+        metavar="INPUTS_CSV",
+        help="run one computer per row of initial RAM values (needs NumPy)",
+    )
+    mode.add_argument(
+        "--profile",
+        metavar="PROFILE_JSON",
+        help="count the cycles of each ROM address and label and write them",
+    )
+    args = arg_parser.parse_args()
+
+    rom = load_rom(args.hack_path)
+    if args.batch:
+        _run_batch(rom, args)
+        return
+    if args.profile:
+        computer = _run_profiled(rom, args)
+    else:
+        computer = (JitHackComputer if args.jit else HackComputer)(rom)
+        elapsed = _timed_run(computer, args)
+        _report("jit" if args.jit else "interpreter", computer, elapsed)
+        if args.compare:
+            jit_computer = JitHackComputer(rom)
+            jit_elapsed = _timed_run(jit_computer, args)
+            _report("jit", jit_computer, jit_elapsed)
+            for register in ("a", "d", "pc", "cycles", "halted", "ram"):
+                if getattr(computer, register) != getattr(jit_computer, register):
+                    raise SystemExit(f"Results differ: {register}")
+            print(f"speedup: {elapsed / jit_elapsed:.1f}x")
+    for addresses in args.dump:
+        for address in addresses:
+            print(f"RAM[{address}] = {computer.ram[address]}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,87 +1,282 @@
 """
 This is the entry file to the HackAssembler.
-Usage: $py HackAssembler.py <prog>.asm
+Usage: $py HackAssembler.py <prog>.asm ... [--binary] [--map]
+    [--single-pass | --stream | --parallel [--workers N]]
+    [--cache-dir DIR [--cache-size MB]] [--stages] [--stages-json PATH]
 Bugs: No error checking, reporting, or handling.
 """
 
+import argparse
 import sys
 from os import path
 from parser import Parser
+from assembler import Assembler
+from build_cache import BuildCache
 import coder
+import hack_file
+from instrumentation import Instrumentation, timed
+from rom_map import MAP_SUFFIX, RomMap
 from symbol_table import SymbolTable
 
 
-def _do_first_pass():
-    """Add label symbols to symbol table."""
-    parser = Parser(asm_path)
-    line_no = -1  # Start at -1 so first line is 0
-    while parser.has_more_lines():
-        parser.advance()
-        if parser.instructionType() is Parser.InstructionType.L_INSTRUCTION:
-            xxx = parser.symbol()
-            if symbols.contains(xxx):
-                raise ValueError(f"Label symbols must be unique.")
-            else:
-                # Add 1 to get ROM address of next instruction
-                symbols.add_symbol(xxx, line_no + 1)
-        else:
-            # Needed so we only add to line no for C and A instructions
-            line_no += 1
+class HackAssembler:
+    """Two-pass assembler that translates one `.asm` file into a `.hack` file."""
+
+    def __init__(
+        self, asm_path, instrumentation: Instrumentation | None = None
+    ) -> None:
+        """Prepare to assemble asm_path.
+
+        Args:
+            asm_path: Path of the Hack assembly file.
+            instrumentation: Where the time of the parse and of each pass is
+                recorded, with the lines read, the instructions by type and
+                the symbols, if anywhere.
+        """
+        self._asm_path = asm_path
+        self.symbols = SymbolTable()
+        """Predefined, label and variable symbols of the program."""
+        self._static_address = 16
+        """The next available RAM address for variable symbols."""
+        self._instrumentation = instrumentation
+
+    def assemble(self, hack_path) -> list[int]:
+        """Write the program in machine language to hack_path.
 
+        Returns:
+            list: The instruction words.
+        """
+        stages = self._instrumentation
+        if stages is None:
+            self._do_first_pass()
+            return self._do_second_pass(hack_path)
+        with stages.stage("first pass"):
+            self._do_first_pass()
+        labels = len(self.symbols) - len(SymbolTable())
+        with stages.stage("second pass"):
+            words = self._do_second_pass(hack_path)
+        stages.count_instructions(words, labels)
+        stages.totals["symbols"] += len(self.symbols)
+        return words
 
-def _do_second_pass():
-    """Write instructions in machine language."""
-    parser = Parser(asm_path)
-    with open(path_root + ".hack", "w", encoding="utf-8") as f:
+    def _parser(self) -> Parser:
+        """Read the assembly file, as the parse stage if instrumented."""
+        if self._instrumentation is None:
+            return Parser(self._asm_path)
+        with self._instrumentation.stage("parse"):
+            parser = Parser(self._asm_path)
+        self._instrumentation.totals["lines read"] += parser.line_count()
+        return parser
+
+    def _do_first_pass(self):
+        """Add label symbols to symbol table."""
+        parser = self._parser()
+        line_no = -1  # Start at -1 so first line is 0
         while parser.has_more_lines():
             parser.advance()
-            match parser.instructionType():
-                case Parser.InstructionType.A_INSTRUCTION:
-                    decimal_address = _get_decimal_equiv(parser.symbol())
-                    line = bin(decimal_address)[2:].zfill(16)
-                case Parser.InstructionType.C_INSTRUCTION:
-                    comp = coder.comp(parser.comp())
-                    dest = coder.dest(parser.dest())
-                    jump = coder.jump(parser.jump())
-                    line = f"111{comp}{dest}{jump}"
-                # Skip L-Instructions
-                case _:
-                    continue
-            f.write(line + "\n" if parser.has_more_lines() else line)
-
-
-def _get_decimal_equiv(xxx: str):
-    """Convert xxx to decimal address.
-
-    If xxx is a constant, its decimal value is returned. If xxx is a symbol,
-    it is added to the symbol table if necessary, and the decimal
-    value it is bound to is retrieved and returned.
-
-    Args:
-        xxx: The symbol or constant in the A-instruction.
-        static_address: The next available RAM address for variable symbols.
+            if parser.instructionType() is Parser.InstructionType.L_INSTRUCTION:
+                xxx = parser.symbol()
+                if self.symbols.contains(xxx):
+                    raise ValueError(f"Label symbols must be unique.")
+                else:
+                    # Add 1 to get ROM address of next instruction
+                    self.symbols.add_symbol(xxx, line_no + 1)
+            else:
+                # Needed so we only add to line no for C and A instructions
+                line_no += 1
+
+    def _do_second_pass(self, hack_path) -> list[int]:
+        """Write instructions in machine language and return them as words."""
+        parser = self._parser()
+        words = []
+        with open(hack_path, "w", encoding="utf-8") as f:
+            while parser.has_more_lines():
+                parser.advance()
+                match parser.instructionType():
+                    case Parser.InstructionType.A_INSTRUCTION:
+                        decimal_address = self._get_decimal_equiv(parser.symbol())
+                        line = bin(decimal_address)[2:].zfill(16)
+                    case Parser.InstructionType.C_INSTRUCTION:
+                        comp = coder.comp(parser.comp())
+                        dest = coder.dest(parser.dest())
+                        jump = coder.jump(parser.jump())
+                        line = f"111{comp}{dest}{jump}"
+                    # Skip L-Instructions
+                    case _:
+                        continue
+                f.write(line + "\n" if parser.has_more_lines() else line)
+                words.append(int(line, 2))
+        return words
+
+    def _get_decimal_equiv(self, xxx: str):
+        """Convert xxx to decimal address.
+
+        If xxx is a constant, its decimal value is returned. If xxx is a symbol,
+        it is added to the symbol table if necessary, and the decimal
+        value it is bound to is retrieved and returned.
+
+        Args:
+            xxx: The symbol or constant in the A-instruction.
+        Returns:
+            int: The decimal address equivalent of xxx.
+        """
+        if xxx.isdecimal():
+            # It's a constant
+            address = int(xxx)
+        else:
+            # It's a variable symbol or label symbol
+            if not self.symbols.contains(xxx):
+                # Need to add new variable symbols to symbol table
+                self.symbols.add_symbol(xxx, self._static_address)
+                self._static_address += 1
+            # Need to replace symbol with decimal value
+            address = self.symbols.get_bound_decimal(xxx)
+        return address
+
+
+def _assemble_two_pass(
+    asm_path,
+    hack_path,
+    cache: BuildCache | None,
+    instrumentation: Instrumentation | None = None,
+) -> tuple[list, SymbolTable]:
+    """Assemble with `HackAssembler`, unless the program is in cache.
+
     Returns:
-        int: The decimal address equivalent of xxx.
+        tuple: The instruction words and the symbol table.
     """
-    global static_address
-    if xxx.isdecimal():
-        # It's a constant
-        address = int(xxx)
-    else:
-        # It's a variable symbol or label symbol
-        if not symbols.contains(xxx):
-            # Need to add new variable symbols to symbol table
-            symbols.add_symbol(xxx, static_address)
-            static_address += 1
-        # Need to replace symbol with decimal value
-        address = symbols.get_bound_decimal(xxx)
-    return address
+    key = None if cache is None else cache.key_file(asm_path)
+    if cache is not None and (cached := cache.get(key)) is not None:
+        words, symbols = cached
+        hack_file.write_hack(hack_path, words)
+        return words, symbols
+    assembler = HackAssembler(asm_path, instrumentation)
+    words = assembler.assemble(hack_path)
+    if cache is not None:
+        cache.put(key, words, assembler.symbols)
+    return words, assembler.symbols
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description="Assemble Hack programs.")
+    arg_parser.add_argument("asm_paths", nargs="+", metavar="asm_path")
+    arg_parser.add_argument(
+        "--binary",
+        action="store_true",
+        help=f"also write packed 16-bit words to a {hack_file.PACKED_SUFFIX} file",
+    )
+    arg_parser.add_argument(
+        "--map",
+        action="store_true",
+        help=f"also write the .asm line of each ROM address and the symbol table"
+        f" to a {MAP_SUFFIX} file",
+    )
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="read the file once and backpatch forward label references",
+    )
+    mode.add_argument(
+        "--stream",
+        action="store_true",
+        help="like --single-pass, in constant memory for very large files",
+    )
+    mode.add_argument(
+        "--parallel",
+        action="store_true",
+        help="like --single-pass, encoding shards of the file on several processes",
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of processes for --parallel, by default the number of CPUs",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        help="reuse the output of files assembled before from this directory",
+    )
+    arg_parser.add_argument(
+        "--cache-size",
+        type=float,
+        default=64,
+        help="size in MB above which least recently used entries are evicted",
+    )
+    arg_parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="report the time of each stage, the instructions by type, the"
+        " symbols and the bytes written on stderr",
+    )
+    arg_parser.add_argument(
+        "--stages-json",
+        metavar="PATH",
+        help="like --stages, also writing the report to a JSON file",
+    )
+    args = arg_parser.parse_args()
+    if args.stream and args.binary:
+        arg_parser.error("--binary is not supported with --stream")
+    if args.stages_json is not None and (
+        args.stages_json.endswith(".asm")
+        or path.realpath(args.stages_json) in map(path.realpath, args.asm_paths)
+    ):
+        arg_parser.error("--stages-json would overwrite an .asm file")
+
+    cache = None
+    if args.cache_dir:
+        cache = BuildCache(args.cache_dir, int(args.cache_size * 2**20))
+    stages = Instrumentation() if args.stages or args.stages_json else None
+    # One assembler for all files, so its encoding tables are reused
+    single_pass = Assembler(cache)
+    for asm_path in args.asm_paths:
+        path_root, _ = path.splitext(asm_path)
+        written = [path_root + ".hack"]
+        if args.single_pass:
+            with timed(stages, "assemble"):
+                words = single_pass.assemble_file(asm_path)
+            with timed(stages, "write"):
+                hack_file.write_hack(path_root + ".hack", words)
+        elif args.stream:
+            with timed(stages, "assemble"):
+                single_pass.assemble_stream(asm_path, path_root + ".hack")
+        elif args.parallel:
+            with timed(stages, "assemble"):
+                words = single_pass.assemble_parallel(asm_path, args.workers)
+            with timed(stages, "write"):
+                hack_file.write_hack(path_root + ".hack", words)
+        else:
+            words, symbols = _assemble_two_pass(
+                asm_path, path_root + ".hack", cache, stages
+            )
+        if args.binary:
+            with timed(stages, "write"):
+                hack_file.write_packed(path_root + hack_file.PACKED_SUFFIX, words)
+            written.append(path_root + hack_file.PACKED_SUFFIX)
+        if args.map:
+            if args.single_pass or args.stream or args.parallel:
+                symbols = single_pass.symbols
+            with timed(stages, "map"):
+                RomMap.scan_file(asm_path, symbols).write(path_root + MAP_SUFFIX)
+            written.append(path_root + MAP_SUFFIX)
+        if stages is not None:
+            if args.single_pass or args.parallel:
+                stages.count_instructions(words)
+            if args.single_pass or args.stream or args.parallel:
+                stages.totals["symbols"] += len(single_pass.symbols)
+            stages.totals["bytes written"] += sum(map(path.getsize, written))
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+        totals = cache.save_stats()
+        print(
+            f"cache: {hits} hits, {misses} misses "
+            f"({totals['hits']} hits, {totals['misses']} misses in total)",
+            file=sys.stderr,
+        )
+    if stages is not None:
+        stages.print_summary()
+        if args.stages_json is not None:
+            stages.write(args.stages_json)
 
 
 if __name__ == "__main__":
-    asm_path = sys.argv[1]
-    path_root, _ = path.splitext(asm_path)
-    symbols = SymbolTable()
-    static_address = 16
-    _do_first_pass()
-    _do_second_pass()
+    _main()
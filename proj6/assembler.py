@@ -0,0 +1,319 @@
+"""Single-pass Hack assembler.
+
+The source is read once. Instructions are encoded straight to integers
+through the code tables in `coder`, and C-instructions that were already
+seen are looked up whole. A-instructions referring to symbols that are not
+yet bound are emitted as placeholders and backpatched once the whole program
+has been read: symbols that turned out to be labels get the label's ROM
+address, and the rest become variables bound to consecutive RAM addresses
+from 16, in order of first use. The result is the same as that of the
+two-pass `HackAssembler`.
+
+`Assembler.assemble_stream` does the same for files too large to hold in
+memory, and `Assembler.assemble_parallel` splits large files into shards
+that are scanned and encoded on a pool of processes.
+"""
+
+import os
+import tempfile
+from array import array
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+import hack_file
+from build_cache import BuildCache
+from coder import COMP_CODES, DEST_CODES, JUMP_CODES
+from symbol_table import SymbolTable
+
+_VARIABLE_BASE_ADDRESS = 16
+
+
+class Assembler:
+    """Translates Hack assembly into machine code, in process.
+
+    An assembler can translate any number of programs. Each program starts
+    from a fresh copy of the predefined symbols, while the machine code of
+    C-instructions is remembered across programs.
+    """
+
+    def __init__(self, cache: BuildCache | None = None) -> None:
+        """Create an assembler.
+
+        Args:
+            cache: Where previously assembled programs are looked up before
+                parsing and new ones are stored.
+        """
+        self._cache = cache
+        self.symbols = SymbolTable()
+        """Symbol table of the last program assembled."""
+        self._c_instruction_words: dict[str, int] = {}
+        """Machine code of each C-instruction encoded so far."""
+
+    def encode_c_instruction(self, instruction: str) -> int:
+        """Return the machine code of a C-instruction, e.g. `AM=M-1` or `D;JGT`."""
+        word = self._c_instruction_words.get(instruction)
+        if word is None:
+            dest, _, comp_jump = instruction.rpartition("=")
+            comp, _, jump = comp_jump.partition(";")
+            try:
+                word = (
+                    0b111 << 13
+                    | COMP_CODES[comp] << 6
+                    | DEST_CODES[dest] << 3
+                    | JUMP_CODES[jump]
+                )
+            except KeyError:
+                raise ValueError(f"Invalid C-instruction: {instruction}") from None
+            self._c_instruction_words[instruction] = word
+        return word
+
+    def assemble(self, source: str) -> array:
+        """Translate Hack assembly source into machine code.
+
+        Returns:
+            array: The instruction words, as an `array('L')`. Programs that
+                overflow the ROM can bind labels to addresses wider than 16 bits.
+        """
+        if self._cache is not None:
+            key = self._cache.key(source)
+            if (cached := self._cache.get(key)) is not None:
+                words, self.symbols = cached
+                return words
+        words = self.assemble_lines(source.splitlines())
+        if self._cache is not None:
+            self._cache.put(key, words, self.symbols)
+        return words
+
+    def assemble_lines(self, lines: Iterable[str]) -> array:
+        """Translate lines of Hack assembly into machine code, see `assemble`.
+
+        The lines are not looked up in the cache, so a translator can hand
+        over the assembly it holds in memory without joining it into text.
+        """
+        self.symbols = SymbolTable()
+        fixups: list[tuple[int, str]] = []
+        words = array("L", self._encode(lines, fixups))
+        for address, word in self._resolve(fixups):
+            words[address] = word
+        return words
+
+    def assemble_file(self, asm_path) -> array:
+        """Read and assemble a `.asm` file, see `assemble`."""
+        with open(asm_path, "rt", encoding="utf-8") as f:
+            return self.assemble(f.read())
+
+    def assemble_stream(self, asm_path, hack_path, chunk_words: int = 65536) -> int:
+        """Assemble a `.asm` file into a `.hack` file in constant memory.
+
+        The input is read and encoded lazily and the words are written in
+        chunks to a temporary file, where fixups are backpatched before it is
+        converted to text. Only the symbol table, the pending fixups and one
+        chunk of words are held in memory. A cached program is written from
+        the cache, but new programs are not added to it since that would
+        require holding their words in memory.
+
+        Returns:
+            int: The number of instructions written.
+        """
+        if self._cache is not None:
+            cached = self._cache.get(self._cache.key_file(asm_path))
+            if cached is not None:
+                words, self.symbols = cached
+                hack_file.write_hack(hack_path, words)
+                return len(words)
+        self.symbols = SymbolTable()
+        fixups: list[tuple[int, str]] = []
+        chunk = array("L")
+        n_words = 0
+        with (
+            open(asm_path, "rt", encoding="utf-8") as f,
+            tempfile.TemporaryFile() as scratch,
+        ):
+            for word in self._encode(f, fixups):
+                chunk.append(word)
+                if len(chunk) == chunk_words:
+                    chunk.tofile(scratch)
+                    n_words += len(chunk)
+                    del chunk[:]
+            chunk.tofile(scratch)
+            n_words += len(chunk)
+
+            for address, word in self._resolve(fixups):
+                scratch.seek(address * chunk.itemsize)
+                scratch.write(array("L", (word,)).tobytes())
+
+            scratch.seek(0)
+            with open(hack_path, "wt", encoding="utf-8") as out:
+                separator = ""
+                while data := scratch.read(chunk_words * chunk.itemsize):
+                    chunk = array("L")
+                    chunk.frombytes(data)
+                    out.write(separator + "\n".join(hack_file.binary_strings(chunk)))
+                    separator = "\n"
+        return n_words
+
+    def assemble_parallel(self, asm_path, workers: int | None = None) -> array:
+        """Assemble a `.asm` file on a pool of worker processes.
+
+        The file is split into shards at line boundaries. The workers first
+        scan their shard for labels and symbol references, from which the
+        label addresses and the variable allocation order of the whole
+        program are fixed. The workers then encode their shard with the
+        symbols it uses and the words are concatenated in order, so the
+        result is the same as that of `assemble`.
+
+        Args:
+            asm_path: Path of the Hack assembly file.
+            workers: Number of processes, by default the number of CPUs.
+        """
+        if self._cache is not None:
+            key = self._cache.key_file(asm_path)
+            if (cached := self._cache.get(key)) is not None:
+                words, self.symbols = cached
+                return words
+        workers = workers or os.cpu_count() or 1
+        shards = _split_file(asm_path, 4 * workers)
+        with ProcessPoolExecutor(workers) as pool:
+            scans = list(pool.map(_scan_shard, shards))
+
+            self.symbols = SymbolTable()
+            base_address = 0
+            for labels, _, n_words in scans:
+                for label, offset in labels:
+                    if self.symbols.contains(label):
+                        raise ValueError(f"Label symbols must be unique.")
+                    self.symbols.add_symbol(label, base_address + offset)
+                base_address += n_words
+            # Bind the variables, in order of first use
+            fixups = [(0, xxx) for _, references, _ in scans for xxx in references]
+            for _ in self._resolve(fixups):
+                pass
+
+            shard_symbols = [
+                {xxx: self.symbols.get_bound_decimal(xxx) for xxx in references}
+                for _, references, _ in scans
+            ]
+            encoded = pool.map(_encode_shard, shards, shard_symbols)
+            words = array("L")
+            for data in encoded:
+                words.frombytes(data)
+        if self._cache is not None:
+            self._cache.put(key, words, self.symbols)
+        return words
+
+    def _encode(self, lines, fixups: list[tuple[int, str]], bind_labels=True):
+        """Yield the machine code of each instruction in lines.
+
+        Labels are added to the symbol table, unless bind_labels is false
+        because they are bound already. A-instructions whose symbol is not
+        bound yet are yielded as 0 and their ROM address and symbol are
+        appended to fixups.
+        """
+        symbols = self.symbols
+        address = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            if "//" in line:
+                line = line[: line.index("//")].rstrip()
+            if line[0] == "@":
+                xxx = line[1:]
+                if xxx.isdecimal():
+                    yield int(xxx)
+                elif symbols.contains(xxx):
+                    yield symbols.get_bound_decimal(xxx)
+                else:
+                    fixups.append((address, xxx))
+                    yield 0
+            elif line[0] == "(" and line[-1] == ")":
+                if bind_labels:
+                    label = line[1:-1]
+                    if symbols.contains(label):
+                        raise ValueError(f"Label symbols must be unique.")
+                    symbols.add_symbol(label, address)
+                continue
+            else:
+                yield self.encode_c_instruction(line)
+            address += 1
+
+    def _resolve(self, fixups: list[tuple[int, str]]):
+        """Yield the ROM address and machine code of each fixup.
+
+        Symbols that are still unbound are variables and are bound to
+        consecutive RAM addresses, in order of first use.
+        """
+        static_address = _VARIABLE_BASE_ADDRESS
+        for address, xxx in fixups:
+            if not self.symbols.contains(xxx):
+                self.symbols.add_symbol(xxx, static_address)
+                static_address += 1
+            yield address, self.symbols.get_bound_decimal(xxx)
+
+
+def _split_file(asm_path, n_shards: int) -> list[tuple[str, int, int]]:
+    """Split a file into about n_shards byte ranges that end at line ends.
+
+    Returns:
+        list: `(path, start, end)` of each non-empty range.
+    """
+    size = os.path.getsize(asm_path)
+    offsets = [0]
+    with open(asm_path, "rb") as f:
+        for i in range(1, n_shards):
+            f.seek(max(size * i // n_shards, offsets[-1]))
+            f.readline()
+            offsets.append(min(f.tell(), size))
+    offsets.append(size)
+    return [
+        (asm_path, start, end) for start, end in zip(offsets, offsets[1:]) if end > start
+    ]
+
+
+def _read_shard(shard: tuple[str, int, int]) -> list[str]:
+    """Return the lines in a byte range of a file."""
+    asm_path, start, end = shard
+    with open(asm_path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start).decode("utf-8").splitlines()
+
+
+def _scan_shard(shard: tuple[str, int, int]) -> tuple[list, list[str], int]:
+    """Find the labels and symbol references in a shard.
+
+    Returns:
+        tuple: The labels with their address relative to the start of the
+            shard, the symbols referenced by A-instructions in order of first
+            use, and the number of instructions.
+    """
+    labels = []
+    references: dict[str, None] = {}
+    n_words = 0
+    for line in _read_shard(shard):
+        line = line.strip()
+        if not line or line.startswith("//"):
+            continue
+        if "//" in line:
+            line = line[: line.index("//")].rstrip()
+        if line[0] == "(" and line[-1] == ")":
+            labels.append((line[1:-1], n_words))
+            continue
+        if line[0] == "@" and not line[1:].isdecimal():
+            references[line[1:]] = None
+        n_words += 1
+    return labels, list(references), n_words
+
+
+_worker_assembler: Assembler | None = None
+"""Assembler of a worker process, kept so its encoding tables are reused."""
+
+
+def _encode_shard(shard: tuple[str, int, int], symbols: dict[str, int]) -> bytes:
+    """Encode a shard whose symbols are all bound and return its words."""
+    global _worker_assembler
+    if _worker_assembler is None:
+        _worker_assembler = Assembler()
+    _worker_assembler.symbols = SymbolTable()
+    for xxx, address in symbols.items():
+        _worker_assembler.symbols.add_symbol(xxx, address)
+    encoded = _worker_assembler._encode(_read_shard(shard), [], bind_labels=False)
+    return array("L", encoded).tobytes()
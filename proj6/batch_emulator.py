@@ -0,0 +1,110 @@
+"""Executes one Hack program on many independent computers at once.
+
+Each computer is a lane of NumPy arrays: the A, D and PC registers have
+shape (lanes,) and RAM has shape (lanes, RAM_SIZE). A step advances every
+lane by one instruction. Lanes whose PCs have diverged are grouped by PC, so
+each distinct instruction is executed once per step for all the lanes at
+that address, using the same decoded instructions as `emulator.HackComputer`.
+
+Requires NumPy.
+"""
+
+import numpy as np
+from emulator import DECODE_TABLE, RAM_SIZE
+from hack_file import ROM_SIZE
+
+_ADDRESS_MASK = RAM_SIZE - 1
+_PC_MASK = ROM_SIZE - 1
+_JUMP_TABLES = {
+    id(table): np.frombuffer(table, dtype=np.uint8).astype(bool)
+    for table in {op[5] for op in DECODE_TABLE if op and op[5]}
+}
+"""NumPy copies of the decoded jump tables, keyed by the id of the original."""
+
+
+class BatchHackComputer:
+    """Many Hack computers sharing one ROM.
+
+    A lane has halted once it reaches the loop `(END) @END 0;JMP`. Halted
+    lanes are no longer stepped and their cycle count stops increasing.
+    """
+
+    def __init__(self, rom, lanes: int) -> None:
+        """Create lanes with zeroed RAM and registers, ready to run rom.
+
+        Args:
+            rom: A sequence of unsigned 16-bit instruction words.
+            lanes: The number of computers.
+        """
+        if len(rom) > ROM_SIZE:
+            raise ValueError(f"Program does not fit in a {ROM_SIZE} word ROM")
+        self.rom = np.zeros(ROM_SIZE, dtype=np.uint16)
+        self.rom[: len(rom)] = rom
+        self.ram = np.zeros((lanes, RAM_SIZE), dtype=np.uint16)
+        self.a = np.zeros(lanes, dtype=np.uint16)
+        self.d = np.zeros(lanes, dtype=np.uint16)
+        self.pc = np.zeros(lanes, dtype=np.int64)
+        self.cycles = np.zeros(lanes, dtype=np.int64)
+        """Number of instructions each lane has executed."""
+        self.halted = np.zeros(lanes, dtype=bool)
+        self._lanes = np.arange(lanes)
+
+    def step(self) -> int:
+        """Execute one instruction in every running lane.
+
+        Returns:
+            int: The number of lanes that executed an instruction.
+        """
+        running = self._lanes[~self.halted]
+        if not len(running):
+            return 0
+        pcs = self.pc[running]
+        first = pcs[0]
+        if (pcs == first).all():
+            self._execute(int(first), running)
+        else:
+            for pc in np.unique(pcs):
+                self._execute(int(pc), running[pcs == pc])
+        self.cycles[running] += 1
+        return len(running)
+
+    def run(self, max_cycles: int) -> int:
+        """Step until every lane has halted or max_cycles steps were taken.
+
+        Returns:
+            int: The number of steps taken.
+        """
+        for steps in range(max_cycles):
+            if not self.step():
+                return steps
+        return max_cycles
+
+    def _execute(self, pc: int, lanes: np.ndarray) -> None:
+        """Execute the instruction at ROM address pc in the given lanes."""
+        word = int(self.rom[pc])
+        op = DECODE_TABLE[word]
+        if op is None:
+            self.a[lanes] = word
+            self.pc[lanes] = (pc + 1) & _PC_MASK
+            return
+        comp, use_m, dest_a, dest_d, dest_m, jump = op
+        a = self.a[lanes]
+        address = a & _ADDRESS_MASK
+        y = self.ram[lanes, address] if use_m else a
+        out = np.broadcast_to(
+            np.asarray(comp(self.d[lanes], y), dtype=np.uint16), lanes.shape
+        )
+        if dest_m:
+            self.ram[lanes, address] = out
+        if dest_a:
+            self.a[lanes] = out
+        if dest_d:
+            self.d[lanes] = out
+        if jump is None:
+            self.pc[lanes] = (pc + 1) & _PC_MASK
+            return
+        taken = _JUMP_TABLES[id(jump)][out]
+        self.pc[lanes] = np.where(taken, a & _PC_MASK, (pc + 1) & _PC_MASK)
+        # Same test as emulator.is_halt_loop
+        if not (dest_a or dest_d or dest_m) and pc and self.rom[pc - 1] == pc - 1:
+            self.halted[lanes[taken & (a == pc - 1)]] = True
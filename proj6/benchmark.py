@@ -0,0 +1,125 @@
+"""
+Measures assembler throughput and peak memory on large generated programs.
+Usage: $py benchmark.py [--size-mb 4 ...] [--repeat 3] [--workers 1 2 4 ...]
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+
+try:
+    import resource  # noqa: F401, Unavailable on Windows
+
+    _measure_rss = True
+except ImportError:
+    _measure_rss = False
+
+_HERE = path.dirname(path.abspath(__file__))
+_MODES = {
+    "two-pass": (),
+    "single-pass": ("--single-pass",),
+    "stream": ("--stream",),
+}
+_PEAK_RSS_WRAPPER = """
+import resource, subprocess, sys
+subprocess.run(sys.argv[1:], check=True)
+print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+"""Runs a command and prints its peak resident set size in KiB."""
+
+
+def generate_asm(size_bytes: int) -> str:
+    """Return assembly source of about size_bytes bytes.
+
+    The source resembles VM translator output: comments, indented
+    instructions, variables, and labels that are referenced both before and
+    after they are declared.
+    """
+    chunks = []
+    size = 0
+    block = 0
+    while size < size_bytes:
+        chunk = (
+            f"// block {block}\n"
+            f"(BLOCK{block})\n"
+            f"\t@SP\n\tAM=M-1\n\tD=M\n\tA=A-1\n\tM=D+M\n"
+            f"\t@var{block % 97}\n\tM=D\n"
+            f"\t@{block % 32768}\n\tD=A\n"
+            f"\t@SP\n\tAM=M+1\n\tA=A-1\n\tM=D\n"
+            f"\t@BLOCK{block + 1}\n\tD;JGT\n"
+            f"\t@BLOCK{max(block - 1, 0)}\n\t0;JMP\n"
+        )
+        chunks.append(chunk)
+        size += len(chunk)
+        block += 1
+    chunks.append(f"(BLOCK{block})\n\t@BLOCK{block}\n\t0;JMP\n")
+    return "".join(chunks)
+
+
+def _run_cli(asm_path: str, *options: str) -> tuple[float, int | None, bytes]:
+    """Run HackAssembler.py.
+
+    Returns:
+        tuple: The elapsed seconds, the peak resident set size in MiB (None
+            where it cannot be measured) and the output.
+    """
+    command = [sys.executable, path.join(_HERE, "HackAssembler.py"), asm_path]
+    if _measure_rss:
+        command = [sys.executable, "-c", _PEAK_RSS_WRAPPER, *command]
+    start = time.perf_counter()
+    result = subprocess.run(
+        [*command, *options], check=True, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    peak_rss = int(result.stdout) // 1024 if _measure_rss else None
+    with open(path.splitext(asm_path)[0] + ".hack", "rb") as f:
+        return elapsed, peak_rss, f.read()
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("--size-mb", type=float, nargs="+", default=[4])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[],
+        help="also run the parallel assembler with each number of processes",
+    )
+    args = arg_parser.parse_args()
+    modes = dict(_MODES)
+    for workers in args.workers:
+        modes[f"parallel-{workers}"] = ("--parallel", "--workers", str(workers))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_path = path.join(tmp, "Bench.asm")
+        for size_mb in args.size_mb:
+            source = generate_asm(int(size_mb * 2**20))
+            n_lines = source.count("\n")
+            with open(asm_path, "wt", encoding="utf-8") as f:
+                f.write(source)
+            print(f"{len(source) / 2**20:.1f} MB, {n_lines} lines")
+            baseline = None
+            outputs = set()
+            for mode, options in modes.items():
+                runs = [_run_cli(asm_path, *options) for _ in range(args.repeat)]
+                best = min(elapsed for elapsed, _, _ in runs)
+                outputs.update(output for _, _, output in runs)
+                baseline = baseline or best
+                print(
+                    f"{mode:>12}: {best:.3f}s, "
+                    f"{len(source) / 2**20 / best:.2f} MB/s, "
+                    f"{n_lines / best:,.0f} lines/s, {baseline / best:.1f}x",
+                    end="",
+                )
+                print(f", peak RSS {runs[0][1]} MiB" if _measure_rss else "")
+            if len(outputs) != 1:
+                raise SystemExit("Assemblers produced different output")
+
+
+if __name__ == "__main__":
+    _main()
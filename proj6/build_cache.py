@@ -0,0 +1,129 @@
+"""On-disk cache of assembled programs.
+
+Entries are keyed by a hash of the assembler version and the source text,
+so a program is only assembled again when its source or the assembler
+changed. Each entry holds the machine code and the resolved symbol table.
+The least recently used entries are evicted when the cache grows past its
+size limit.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from array import array
+from symbol_table import SymbolTable
+
+ASSEMBLER_VERSION = "1"
+"""Changes whenever the assembler could produce different output."""
+
+_ENTRY_SUFFIX = ".entry"
+_STATS_FILE = "stats.json"
+
+
+class BuildCache:
+    """Content-addressed cache of assembler outputs in a directory.
+
+    An entry file holds the symbol table as a line of JSON followed by the
+    words as little-endian 32-bit integers. Reading an entry refreshes its
+    modification time, which eviction uses as its last use.
+    """
+
+    def __init__(self, directory, max_bytes: int = 64 * 2**20) -> None:
+        """Open or create the cache.
+
+        Args:
+            directory: Where entries are stored.
+            max_bytes: Total entry size above which entries are evicted.
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.hits = 0
+        """Lookups that found an entry since the cache was opened."""
+        self.misses = 0
+        """Lookups that found no entry since the cache was opened."""
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source: str) -> str:
+        """Return the key of an assembly source text."""
+        digest = hashlib.sha256(ASSEMBLER_VERSION.encode() + b"\0")
+        digest.update(source.encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def key_file(asm_path, chunk_size: int = 2**20) -> str:
+        """Return the key of a `.asm` file without holding it in memory."""
+        digest = hashlib.sha256(ASSEMBLER_VERSION.encode() + b"\0")
+        with open(asm_path, "rt", encoding="utf-8") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> tuple[array, SymbolTable] | None:
+        """Return the words and symbol table stored under key, if any."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                symbols = json.loads(f.readline())
+                words = array("I")
+                words.frombytes(f.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(entry_path)
+        self.hits += 1
+        if sys.byteorder != "little":
+            words.byteswap()
+        return array("L", words), SymbolTable.from_dict(symbols)
+
+    def put(self, key: str, words, symbols: SymbolTable) -> None:
+        """Store words and symbols under key and evict old entries."""
+        words = array("I", words)
+        if sys.byteorder != "little":
+            words.byteswap()
+        header = json.dumps(symbols.to_dict(), separators=(",", ":"))
+        # Write to a temporary file first so readers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=self._directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.encode("utf-8") + b"\n")
+            words.tofile(f)
+        os.replace(temp_path, self._entry_path(key))
+        self._evict()
+
+    def save_stats(self) -> dict[str, int]:
+        """Add this session's hits and misses to the totals kept on disk.
+
+        Returns:
+            dict: The updated totals.
+        """
+        stats_path = os.path.join(self._directory, _STATS_FILE)
+        try:
+            with open(stats_path, "rt", encoding="utf-8") as f:
+                totals = json.load(f)
+        except FileNotFoundError:
+            totals = {"hits": 0, "misses": 0}
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        with open(stats_path, "wt", encoding="utf-8") as f:
+            json.dump(totals, f)
+        self.hits = self.misses = 0
+        return totals
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._directory, key + _ENTRY_SUFFIX)
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache fits."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.endswith(_ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            os.remove(entry_path)
+            total -= size
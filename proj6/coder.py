@@ -110,3 +110,26 @@ def jump(mnemonic: str) -> str:
         case "JMP":
             binary += "111"
     return binary
+
+
+DEST_CODES = {
+    mnemonic: int(dest(mnemonic), 2)
+    for mnemonic in ("", "M", "D", "DM", "MD", "A", "AM", "AD", "ADM", "AMD")
+}
+"""Integer codes of the dest mnemonics accepted by `dest`."""
+
+COMP_CODES = {
+    mnemonic: int(comp(mnemonic), 2)
+    for mnemonic in (
+        "0", "1", "-1", "D", "A", "!D", "!A", "-D", "-A", "D+1", "A+1", "D-1",
+        "A-1", "D+A", "D-A", "A-D", "D&A", "D|A", "M", "!M", "-M", "M+1",
+        "M-1", "D+M", "D-M", "M-D", "D&M", "D|M",
+    )  # fmt: skip
+}
+"""Integer codes (a-bit and c-bits) of the comp mnemonics accepted by `comp`."""
+
+JUMP_CODES = {
+    mnemonic: int(jump(mnemonic), 2)
+    for mnemonic in ("", "JGT", "JEQ", "JGE", "JLT", "JNE", "JLE", "JMP")
+}
+"""Integer codes of the jump mnemonics accepted by `jump`."""
@@ -0,0 +1,224 @@
+"""Executes Hack machine language programs.
+
+Every possible 16-bit instruction word is decoded once, when the module is
+imported, into `DECODE_TABLE`. The fetch-execute loop then only has to index
+that table instead of slicing the instruction's bits on every cycle.
+"""
+
+from array import array
+from hack_file import ROM_SIZE
+
+RAM_SIZE = 32768
+"""Number of 16-bit words addressable by the A register (RAM, SCREEN, KBD)."""
+SCREEN = 16384
+KBD = 24576
+
+_ADDRESS_MASK = RAM_SIZE - 1
+_PC_MASK = ROM_SIZE - 1
+
+_ALU_EXPRESSIONS = {
+    0b101010: "0",
+    0b111111: "1",
+    0b111010: "0xFFFF",
+    0b001100: "x",
+    0b110000: "y",
+    0b001101: "x ^ 0xFFFF",
+    0b110001: "y ^ 0xFFFF",
+    0b001111: "-x & 0xFFFF",
+    0b110011: "-y & 0xFFFF",
+    0b011111: "(x + 1) & 0xFFFF",
+    0b110111: "(y + 1) & 0xFFFF",
+    0b001110: "(x - 1) & 0xFFFF",
+    0b110010: "(y - 1) & 0xFFFF",
+    0b000010: "(x + y) & 0xFFFF",
+    0b010011: "(x - y) & 0xFFFF",
+    0b000111: "(y - x) & 0xFFFF",
+    0b000000: "x & y",
+    0b010101: "x | y",
+}
+"""Simplified expressions for the comp codes listed in the Hack specification."""
+
+_JUMP_CONDITIONS = {
+    0b001: "0 < {0} < 0x8000",  # JGT
+    0b010: "{0} == 0",  # JEQ
+    0b011: "{0} < 0x8000",  # JGE
+    0b100: "{0} >= 0x8000",  # JLT
+    0b101: "{0} != 0",  # JNE
+    0b110: "{0} == 0 or {0} >= 0x8000",  # JLE
+    0b111: "True",  # JMP
+}
+"""Jump conditions on a 16-bit ALU output, where bit 15 is the sign bit."""
+
+
+def alu_expression(control: int) -> str:
+    """Return a Python expression computing the ALU output.
+
+    The expression reads the D register as `x` and the A register (or M)
+    as `y`, both unsigned 16-bit ints, and evaluates to an unsigned 16-bit
+    int. Comp codes outside the specification are derived from the ALU
+    control bits so that every instruction word has defined behavior.
+
+    Args:
+        control: The six ALU control bits zx, nx, zy, ny, f, no.
+    """
+    if control in _ALU_EXPRESSIONS:
+        return _ALU_EXPRESSIONS[control]
+    zx, nx, zy, ny, f, no = ((control >> shift) & 1 for shift in range(5, -1, -1))
+    x = "0" if zx else "x"
+    if nx:
+        x = f"({x} ^ 0xFFFF)"
+    y = "0" if zy else "y"
+    if ny:
+        y = f"({y} ^ 0xFFFF)"
+    out = f"({x} + {y}) & 0xFFFF" if f else f"{x} & {y}"
+    return f"({out}) ^ 0xFFFF" if no else out
+
+
+def jump_condition(jump: int, value: str) -> str:
+    """Return a Python expression that is true if the jump should be taken.
+
+    Args:
+        jump: The three jump bits of a C-instruction, which must not be 0.
+        value: The expression holding the ALU output.
+    """
+    return _JUMP_CONDITIONS[jump].format(value)
+
+
+def _jump_table(jump: int) -> bytes:
+    """Return a table indexed by ALU output that is truthy if jump is taken."""
+    lt, eq, gt = bool(jump & 0b100), bool(jump & 0b010), bool(jump & 0b001)
+    return bytes([eq]) + bytes([gt]) * 0x7FFF + bytes([lt]) * 0x8000
+
+
+def _build_decode_table() -> list:
+    """Decode every 16-bit word.
+
+    A-instructions decode to `None`. C-instructions decode to the tuple
+    `(comp, use_m, dest_a, dest_d, dest_m, jump)`, where comp is a function
+    of (D, A or M) and jump is `None` or a table indexed by the ALU output.
+    """
+    comps = [eval(f"lambda x, y: {alu_expression(c)}") for c in range(64)]
+    jumps = [None] + [_jump_table(j) for j in range(1, 8)]
+    c_ops = [
+        (
+            comps[(low >> 6) & 0b111111],
+            bool(low & 0x1000),
+            bool(low & 0b100000),
+            bool(low & 0b010000),
+            bool(low & 0b001000),
+            jumps[low & 0b111],
+        )
+        for low in range(0x2000)
+    ]
+    # Bits 13 and 14 of a C-instruction are unused
+    return [None] * 0x8000 + c_ops * 4
+
+
+DECODE_TABLE = _build_decode_table()
+
+
+class HackComputer:
+    """The Hack computer: a CPU with 32K words of ROM and 32K words of RAM.
+
+    A program has halted once it reaches the conventional infinite loop
+    `(END) @END 0;JMP`, after which `run` executes no more cycles.
+    """
+
+    def __init__(self, rom=None) -> None:
+        """Create a computer with zeroed RAM and registers.
+
+        Args:
+            rom: Instruction words to load, see `load`.
+        """
+        self.ram = array("H", bytes(2 * RAM_SIZE))
+        self.rom = array("H")
+        self.a = self.d = self.pc = 0
+        self.cycles = 0
+        """Total number of instructions executed since creation."""
+        self.halted = False
+        if rom is not None:
+            self.load(rom)
+
+    def load(self, rom) -> None:
+        """Load a program and reset the computer.
+
+        Args:
+            rom: A sequence of unsigned 16-bit instruction words, such as
+                an `array('H')`. It is used without copying; words past its
+                end read as 0.
+        """
+        if len(rom) > ROM_SIZE:
+            raise ValueError(f"Program does not fit in a {ROM_SIZE} word ROM")
+        self.rom = rom
+        self.reset()
+
+    def reset(self) -> None:
+        """Restart the program from ROM address 0, as the reset bit does."""
+        self.pc = 0
+        self.halted = False
+
+    def step(self) -> int:
+        """Execute a single instruction and return the cycles executed."""
+        return self.run(1)
+
+    def run(self, max_cycles: int) -> int:
+        """Execute instructions until the program halts or max_cycles is reached.
+
+        Returns:
+            int: The number of instructions executed.
+        """
+        if self.halted:
+            return 0
+        rom, ram, decode = self.rom, self.ram, DECODE_TABLE
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while executed < max_cycles:
+            try:
+                word = rom[pc]
+            except IndexError:
+                word = 0
+            executed += 1
+            op = decode[word]
+            if op is None:
+                a = word
+                pc = (pc + 1) & _PC_MASK
+                continue
+            comp, use_m, dest_a, dest_d, dest_m, jump = op
+            out = comp(d, ram[a & _ADDRESS_MASK] if use_m else a)
+            target = a
+            if dest_m:
+                ram[a & _ADDRESS_MASK] = out
+            if dest_a:
+                a = out
+            if dest_d:
+                d = out
+            if jump is not None and jump[out]:
+                if is_halt_loop(rom, pc, target, op):
+                    pc = target
+                    self.halted = True
+                    break
+                pc = target & _PC_MASK
+            else:
+                pc = (pc + 1) & _PC_MASK
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        return executed
+
+
+def is_halt_loop(rom, pc: int, target: int, op: tuple) -> bool:
+    """Is the jump at pc to target the loop `(END) @END 0;JMP`?
+
+    Such a loop leaves every register and RAM word unchanged, so it can
+    never be left.
+
+    Args:
+        rom: The program being executed.
+        pc: Address of the jump instruction.
+        target: Address being jumped to.
+        op: Decoded jump instruction.
+    """
+    return (
+        target == pc - 1
+        and rom[target] == target
+        and not (op[2] or op[3] or op[4])
+    )
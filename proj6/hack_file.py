@@ -0,0 +1,88 @@
+"""Reading and writing Hack machine language files.
+
+Besides the text `.hack` format, programs can be stored packed: one
+little-endian 16-bit word per instruction, in a `.bin` file next to the
+`.hack` file. Packed files are memory-mapped straight into ROM images.
+"""
+
+import mmap
+import sys
+from array import array
+from functools import cache
+
+ROM_SIZE = 32768
+"""Number of 16-bit words in the Hack instruction memory (ROM32K)."""
+PACKED_SUFFIX = ".bin"
+
+
+def read_hack(hack_path) -> array:
+    """Return the words of a text `.hack` file as an `array('H')`.
+
+    Each non-blank line of the file holds one 16-character binary word.
+    """
+    with open(hack_path, "rt", encoding="utf-8") as f:
+        words = array("H", (int(line, 2) for line in f if line.strip()))
+    if len(words) > ROM_SIZE:
+        raise ValueError(f"{hack_path} does not fit in a {ROM_SIZE} word ROM")
+    return words
+
+
+@cache
+def _binary_strings() -> list[str]:
+    """Return the 16-character binary string of every 16-bit word."""
+    return [f"{word:016b}" for word in range(0x10000)]
+
+
+def binary_strings(words) -> list[str]:
+    """Return the lines of the text `.hack` format for words.
+
+    Words wider than 16 bits are written in full, as `HackAssembler` does.
+    """
+    binary = _binary_strings()
+    return [binary[word] if word <= 0xFFFF else f"{word:016b}" for word in words]
+
+
+def write_hack(hack_path, words) -> None:
+    """Write words to hack_path in the text `.hack` format, one per line."""
+    with open(hack_path, "wt", encoding="utf-8") as f:
+        f.write("\n".join(binary_strings(words)))
+
+
+def write_packed(bin_path, words) -> None:
+    """Write words to bin_path as packed little-endian 16-bit words."""
+    try:
+        words = array("H", words)
+    except OverflowError:
+        raise ValueError(f"Program does not fit in a {ROM_SIZE} word ROM") from None
+    if sys.byteorder != "little":
+        words.byteswap()
+    with open(bin_path, "wb") as f:
+        words.tofile(f)
+
+
+def map_packed(bin_path) -> memoryview:
+    """Memory-map a packed file and return a read-only view of its words.
+
+    The words are not copied, except on big-endian machines where their
+    bytes have to be swapped.
+    """
+    with open(bin_path, "rb") as f:
+        if not f.seek(0, 2):
+            return memoryview(array("H"))
+        words = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    if len(words) % 2:
+        raise ValueError(f"{bin_path} does not hold whole 16-bit words")
+    if len(words) > 2 * ROM_SIZE:
+        raise ValueError(f"{bin_path} does not fit in a {ROM_SIZE} word ROM")
+    if sys.byteorder != "little":
+        swapped = array("H", words.tobytes())
+        swapped.byteswap()
+        return memoryview(swapped)
+    return words.cast("H")
+
+
+def load_rom(path):
+    """Load a `.hack` or packed `.bin` file as a sequence of words."""
+    if str(path).endswith(PACKED_SUFFIX):
+        return map_packed(path)
+    return read_hack(path)
@@ -0,0 +1,107 @@
+"""Records the time spent in each stage of a build and what the stages did.
+
+Instrumentation is opt-in: the assembler and the VM translator take an
+`Instrumentation`, or None, and only look at it once per stage, never per
+instruction or command, so that builds without it run as before. Counts
+that can be worked out from the output, such as the number of
+instructions of each type, are computed from it after the stage.
+"""
+
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+A_INSTRUCTION = "A_INSTRUCTION"
+C_INSTRUCTION = "C_INSTRUCTION"
+L_INSTRUCTION = "L_INSTRUCTION"
+"""Names of the instruction types counted, as in `Parser.InstructionType`."""
+
+
+class Instrumentation:
+    """Wall time of the stages of a build and counters of their work."""
+
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+        """Seconds spent in each stage, in the order they first ran, not
+        counting the stages timed inside them."""
+        self.counts: dict[str, Counter[str]] = {}
+        """Counters by group, such as instructions or commands by type."""
+        self.totals: Counter[str] = Counter()
+        """Totals such as lines read, symbols and bytes written."""
+        self._nested: list[float] = []
+        """Seconds of the stages timed inside each stage being timed."""
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the body of a with statement as stage name.
+
+        Stages can be nested, and the time of an inner stage only counts
+        toward the inner one. A stage entered several times adds up.
+        """
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = self._nested.pop()
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - inner
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def count(self, group: str, counts) -> None:
+        """Add counts, a mapping or iterable of keys, to a group of
+        counters."""
+        self.counts.setdefault(group, Counter()).update(counts)
+
+    def count_instructions(self, words, labels: int | None = None) -> None:
+        """Count the instructions of a program by type.
+
+        Args:
+            words: The machine code of the program. A-instructions are the
+                words with the most significant bit clear.
+            labels: The number of label declarations, if known.
+        """
+        a_instructions = sum(1 for word in words if word < 0x8000)
+        counts = {
+            A_INSTRUCTION: a_instructions,
+            C_INSTRUCTION: len(words) - a_instructions,
+        }
+        if labels is not None:
+            counts[L_INSTRUCTION] = labels
+        self.count("instructions", counts)
+
+    def report(self) -> dict:
+        """Return the stages and counters as a JSON-serializable dict."""
+        return {
+            "seconds": {name: round(s, 6) for name, s in self.seconds.items()},
+            "total_seconds": round(sum(self.seconds.values()), 6),
+            "counts": {group: dict(c) for group, c in self.counts.items()},
+            "totals": dict(self.totals),
+        }
+
+    def write(self, report_path) -> None:
+        """Write the report to a JSON file, see `report`."""
+        with open(report_path, "wt", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=1)
+
+    def print_summary(self, file=sys.stderr) -> None:
+        """Print the time of each stage and the counters, to stderr by
+        default."""
+        total = sum(self.seconds.values())
+        for name, seconds in self.seconds.items():
+            percent = 100 * seconds / total if total else 0.0
+            print(f"{name}: {seconds * 1000:.1f} ms ({percent:.0f}%)", file=file)
+        for group, counts in self.counts.items():
+            items = ", ".join(f"{key} {n}" for key, n in counts.items())
+            print(f"{group}: {items}", file=file)
+        for name, n in self.totals.items():
+            print(f"{name}: {n}", file=file)
+
+
+def timed(instrumentation: Instrumentation | None, name: str):
+    """Return a context manager timing stage name, which does nothing
+    without instrumentation."""
+    return nullcontext() if instrumentation is None else instrumentation.stage(name)
@@ -0,0 +1,168 @@
+"""Executes Hack programs by compiling them into Python functions.
+
+The ROM is split into basic blocks: straight-line runs of instructions that
+start at an address control is transferred to and end with the first
+instruction that may jump. Each block is compiled on first use into a Python
+function, so execution dispatches once per block instead of once per
+instruction. Within a block, values loaded by A-instructions are folded into
+the generated code as constants.
+
+Compiled blocks are cached by ROM content, so programs that are loaded
+again (or by several computers) are only compiled once. Only the blocks of
+the few ROMs loaded last are kept, so a process that loads many programs
+does not hold on to all of their blocks.
+"""
+
+import hashlib
+import re
+from array import array
+from collections import OrderedDict
+from emulator import HackComputer, alu_expression, jump_condition
+from hack_file import ROM_SIZE
+
+_MAX_BLOCK_LENGTH = 256
+"""Longest run of instructions compiled into a single block."""
+_OPERAND = re.compile(r"\b[xy]\b")
+
+_CACHED_ROMS = 4
+"""Number of ROMs whose compiled blocks are kept after they are loaded."""
+_block_cache: OrderedDict[bytes, dict[int, tuple]] = OrderedDict()
+"""Compiled blocks of the ROMs loaded last, keyed by a hash of the ROM's
+words, from least to most recently loaded."""
+
+
+def _rom_key(rom) -> bytes:
+    """Return the hash identifying a ROM's contents, which may be any
+    sequence of words, as `HackComputer.load` accepts."""
+    if not (isinstance(rom, array) and rom.typecode == "H"):
+        rom = array("H", rom)
+    return hashlib.sha256(memoryview(rom).cast("B")).digest()
+
+
+def _substitute(expression: str, x: str, y: str) -> str:
+    """Replace the ALU operands x and y in expression."""
+    return _OPERAND.sub(lambda m: x if m.group() == "x" else y, expression)
+
+
+def block_source(rom, start: int) -> tuple[str, int, int]:
+    """Generate Python source for the basic block starting at start.
+
+    The source defines `block(ram, a, d)`, which executes the block and
+    returns the new values of A, D and the PC.
+
+    Returns:
+        tuple: The source, the number of instructions in the block and the
+            jump target that would make the block's final jump a halt loop
+            (-1 if it has none).
+    """
+    body: list[str] = []
+    a_const = None  # A's value, while it is set by an A-instruction
+    length = 0
+    halt_pc = -1
+    next_pc = f"{start}"
+    pc = start
+    while True:
+        word = rom[pc] if pc < len(rom) else 0
+        length += 1
+        if word < 0x8000:
+            a_const = word
+        else:
+            a_expr = "a" if a_const is None else f"{a_const}"
+            address = "a & 0x7FFF" if a_const is None else f"{a_const & 0x7FFF}"
+            y = f"ram[{address}]" if word & 0x1000 else a_expr
+            expression = _substitute(alu_expression((word >> 6) & 0x3F), "d", y)
+            dest_a, dest_d, dest_m = word & 0b100000, word & 0b10000, word & 0b1000
+            jump = word & 0b111
+            if jump and dest_a and a_const is None:
+                body.append("j = a")
+                a_expr = "j"
+            if jump == 0b111 and not (dest_a or dest_d or dest_m):
+                pass  # Unconditional jump, the ALU output is unused
+            elif not jump and [dest_a, dest_d, dest_m].count(0) == 2:
+                target = "a" if dest_a else "d" if dest_d else f"ram[{address}]"
+                body.append(f"{target} = {expression}")
+            elif jump or dest_a or dest_d or dest_m:
+                body.append(f"t = {expression}")
+                if dest_m:
+                    body.append(f"ram[{address}] = t")
+                if dest_a:
+                    body.append("a = t")
+                if dest_d:
+                    body.append("d = t")
+            if dest_a:
+                a_const = None
+            if jump:
+                # Same test as emulator.is_halt_loop, with the target unknown
+                if not (dest_a or dest_d or dest_m) and pc and rom[pc - 1] == pc - 1:
+                    halt_pc = pc - 1
+                target = f"{a_expr} & 0x7FFF" if a_expr in ("a", "j") else a_expr
+                fall_through = (pc + 1) & (ROM_SIZE - 1)
+                if jump == 0b111:
+                    next_pc = target
+                else:
+                    condition = jump_condition(jump, "t")
+                    next_pc = f"{target} if {condition} else {fall_through}"
+                break
+        pc += 1
+        if length == _MAX_BLOCK_LENGTH or pc == ROM_SIZE:
+            next_pc = f"{pc & (ROM_SIZE - 1)}"
+            break
+    if a_const is not None:
+        body.append(f"a = {a_const}")
+    body.append(f"return a, d, {next_pc}")
+    source = "def block(ram, a, d):\n" + "".join(f"    {s}\n" for s in body)
+    return source, length, halt_pc
+
+
+def compile_block(rom, start: int) -> tuple:
+    """Compile the basic block starting at start.
+
+    Returns:
+        tuple: `(function, length, halt_pc)`, see `block_source`.
+    """
+    source, length, halt_pc = block_source(rom, start)
+    namespace: dict = {}
+    exec(compile(source, f"<hack block {start}>", "exec"), namespace)
+    return namespace["block"], length, halt_pc
+
+
+class JitHackComputer(HackComputer):
+    """A `HackComputer` that executes compiled basic blocks.
+
+    Registers, RAM and cycle counts match those of an instruction-at-a-time
+    run: when fewer cycles remain than a block's length, the remaining
+    instructions are interpreted.
+    """
+
+    def load(self, rom) -> None:
+        super().load(rom)
+        key = _rom_key(rom)
+        self._blocks = _block_cache.setdefault(key, {})
+        _block_cache.move_to_end(key)
+        if len(_block_cache) > _CACHED_ROMS:
+            _block_cache.popitem(last=False)
+
+    def run(self, max_cycles: int) -> int:
+        if self.halted:
+            return 0
+        rom, ram, blocks = self.rom, self.ram, self._blocks
+        a, d, pc = self.a, self.d, self.pc
+        executed = 0
+        while True:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = compile_block(rom, pc)
+            function, length, halt_pc = block
+            if executed + length > max_cycles:
+                break
+            a, d, pc = function(ram, a, d)
+            executed += length
+            if pc == halt_pc:
+                self.halted = True
+                break
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += executed
+        if not self.halted and executed < max_cycles:
+            executed += super().run(max_cycles - executed)
+        return executed
+
@@ -23,6 +23,10 @@ class Parser:
                 # strip() needed so lines indentions are removed
                 self._lines.append(line.strip())
 
+    def line_count(self) -> int:
+        """Number of lines in the assembly file, including comments and blank lines"""
+        return len(self._lines)
+
     def has_more_lines(self) -> bool:
         """Are there more lines in the assembly file to parse?"""
         return self._index + 1 < len(self._lines)
@@ -31,12 +35,13 @@ class Parser:
         """Advance to the next valid instruction, skipping comments and blank lines"""
         self._index += 1
         self._current_instruction = self._lines[self._index]
-        if (
+        while (
             self._current_instruction.startswith("//")
             # Check for "" since strip() turns lines with just "\n" into ""
             or self._current_instruction == ""
         ) and self.has_more_lines():
-            self.advance()
+            self._index += 1
+            self._current_instruction = self._lines[self._index]
 
     def instructionType(self) -> InstructionType:
         """Return the type of currently selected instruction
@@ -0,0 +1,218 @@
+"""Attributes the cycles of a Hack program to its ROM addresses and labels.
+
+`ProfilingHackComputer` runs compiled basic blocks like `JitHackComputer`
+and counts how many times each block is entered, a single array increment
+per block. The cycles of each ROM address are only worked out from these
+counts when the profile is read, so long runs stay nearly as fast as
+unprofiled ones.
+
+Addresses are grouped into regions by the labels of the program, see
+`label_regions`, so that the cycles of a translated VM program add up per
+function and per shared snippet. A region is called each time control
+jumps to its first address from another region.
+"""
+
+import json
+import re
+from array import array
+from emulator import HackComputer
+from hack_file import ROM_SIZE
+from jit import JitHackComputer, compile_block
+
+START_REGION = "(start)"
+"""Name of the region of the instructions before the first label."""
+
+
+_LOCAL_LABEL = re.compile(r"\$|\.RET_ADDRESS_|\.(EQ|LT|GT)_END\d+$")
+"""Labels that the VM translator declares inside a function."""
+
+
+def is_local_label(label: str, labels: dict[str, int]) -> bool:
+    """Is label part of the region of the code before it?
+
+    Labels that the VM translator declares inside functions, such as
+    `fn$label` and the return addresses of calls and comparisons, are local,
+    and so is the `X_END` label of a comparison snippet `X_START`. Any other
+    label starts a region of its own name.
+    """
+    if _LOCAL_LABEL.search(label):
+        return True
+    return label.endswith("_END") and label[:-4] + "_START" in labels
+
+
+def label_regions(labels: dict[str, int]) -> tuple[list[str], array, set[int]]:
+    """Group the ROM addresses of a program into regions.
+
+    Each address belongs to the region of the last label declared at or
+    before it that is not local, see `is_local_label`.
+
+    Args:
+        labels: ROM address of each label, in declaration order.
+
+    Returns:
+        tuple: The region names, the index in names of the region of each
+            ROM address as an `array('H')`, and the addresses where a
+            region starts.
+    """
+    names = [START_REGION]
+    regions = array("H", bytes(2 * ROM_SIZE))
+    starts = sorted(
+        (address, label)
+        for label, address in labels.items()
+        if not is_local_label(label, labels)
+    )
+    for i, (address, label) in enumerate(starts):
+        end = starts[i + 1][0] if i + 1 < len(starts) else ROM_SIZE
+        regions[address:end] = array("H", [len(names)]) * (end - address)
+        names.append(label)
+    return names, regions, {address for address, _ in starts}
+
+
+class ProfilingHackComputer(JitHackComputer):
+    """A `JitHackComputer` that counts the cycles spent at each ROM address.
+
+    Registers, RAM and cycle counts are the same as without profiling.
+    Counts add up over runs until `clear_profile` is called.
+    """
+
+    def __init__(self, rom=None, labels: dict[str, int] | None = None) -> None:
+        """Create a computer with zeroed RAM, registers and counts.
+
+        Args:
+            rom: Instruction words to load, see `load`.
+            labels: ROM address of each label of the program, such as
+                `rom_map.RomMap.labels`, or None to profile by address only.
+        """
+        self.region_names, self._regions, self._starts = label_regions(labels or {})
+        self.clear_profile()
+        super().__init__(rom)
+
+    def load(self, rom) -> None:
+        super().load(rom)
+        self._profiled_blocks: dict[int, tuple] = {}
+        """Compiled blocks with the regions they enter and leave, by address."""
+
+    def clear_profile(self) -> None:
+        """Forget the counts of previous runs."""
+        self._entries = array("Q", bytes(8 * ROM_SIZE))
+        """Number of times the block at each address was executed."""
+        self._stepped = array("Q", bytes(8 * ROM_SIZE))
+        """Instructions executed one at a time at each address."""
+        self.calls = [0] * len(self.region_names)
+        """Number of times each region was jumped to from another region."""
+        self._region = 0
+        """Region of the last instruction executed."""
+
+    def _profiled_block(self, pc: int) -> tuple:
+        """Return the block at pc, with the region it is called as, or -1 if
+        pc does not start a region, and the region of its last instruction."""
+        block = self._blocks.get(pc)
+        if block is None:
+            block = self._blocks[pc] = compile_block(self.rom, pc)
+        function, length, halt_pc = block
+        called = self._regions[pc] if pc in self._starts else -1
+        last = self._regions[(pc + length - 1) & (ROM_SIZE - 1)]
+        return function, length, halt_pc, called, last
+
+    def run(self, max_cycles: int) -> int:
+        if self.halted:
+            return 0
+        ram, blocks = self.ram, self._profiled_blocks
+        entries, calls = self._entries, self.calls
+        a, d, pc, region = self.a, self.d, self.pc, self._region
+        executed = 0
+        while True:
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self._profiled_block(pc)
+            function, length, halt_pc, called, last = block
+            if executed + length > max_cycles:
+                break
+            entries[pc] += 1
+            if called != region and called >= 0:
+                calls[called] += 1
+            region = last
+            a, d, pc = function(ram, a, d)
+            executed += length
+            if pc == halt_pc:
+                self.halted = True
+                break
+        self.a, self.d, self.pc, self._region = a, d, pc, region
+        self.cycles += executed
+        # Interpret the few instructions left one at a time to count them
+        while executed < max_cycles and not self.halted:
+            self._stepped[self.pc] += 1
+            self._region = self._regions[self.pc]
+            executed += HackComputer.run(self, 1)
+        return executed
+
+    def address_cycles(self) -> array:
+        """Return the number of cycles executed at each ROM address, as an
+        `array('Q')`."""
+        cycles = array("Q", self._stepped)
+        for start, (_, length, *_) in self._profiled_blocks.items():
+            count = self._entries[start]
+            if count:
+                for address in range(start, start + length):
+                    cycles[address] += count
+        return cycles
+
+    def region_cycles(self) -> dict[str, int]:
+        """Return the number of cycles executed in each region, by name."""
+        totals = [0] * len(self.region_names)
+        regions = self._regions
+        for address, count in enumerate(self.address_cycles()):
+            if count:
+                totals[regions[address]] += count
+        return dict(zip(self.region_names, totals))
+
+    def profile(self, asm_lines=None) -> dict:
+        """Return the profile as a JSON-serializable dict.
+
+        It holds the total cycles, the flat profile of the regions sorted by
+        decreasing cycles, the call counts of the regions sorted by
+        decreasing calls, and the cycles of each address executed.
+
+        Args:
+            asm_lines: The `.asm` line of each ROM address, such as
+                `rom_map.RomMap.asm_lines`, to include in the addresses.
+        """
+        address_cycles = self.address_cycles()
+        total = sum(address_cycles)
+        region_cycles = self.region_cycles()
+        calls = dict(zip(self.region_names, self.calls))
+        flat = [
+            {
+                "region": name,
+                "cycles": cycles,
+                "percent": round(100 * cycles / total, 2) if total else 0.0,
+                "calls": calls[name],
+            }
+            for name, cycles in region_cycles.items()
+            if cycles
+        ]
+        flat.sort(key=lambda entry: entry["cycles"], reverse=True)
+        addresses = []
+        for address, cycles in enumerate(address_cycles):
+            if cycles:
+                entry = {"address": address, "cycles": cycles}
+                if asm_lines is not None and address < len(asm_lines):
+                    entry["asm_line"] = asm_lines[address]
+                addresses.append(entry)
+        return {
+            "cycles": total,
+            "flat": flat,
+            "calls": {
+                name: count
+                for name, count in sorted(calls.items(), key=lambda item: -item[1])
+                if count
+            },
+            "addresses": addresses,
+        }
+
+    def write_profile(self, profile_path, asm_lines=None) -> dict:
+        """Write the profile to a JSON file and return it, see `profile`."""
+        profile = self.profile(asm_lines)
+        with open(profile_path, "wt", encoding="utf-8") as f:
+            json.dump(profile, f, indent=1)
+        return profile
@@ -0,0 +1,83 @@
+"""Debug information mapping the ROM addresses of a program to its source.
+
+A map file is JSON holding the `.asm` file it was assembled from, the
+1-based line of that file that each ROM address was assembled from, the
+label declarations and the whole symbol table. It is written next to the
+`.hack` file with the suffix `MAP_SUFFIX`, and lets profilers and emulators
+find the source of any PC with a list lookup.
+"""
+
+import json
+from array import array
+from collections.abc import Iterable
+from symbol_table import SymbolTable
+
+MAP_SUFFIX = ".hack.map"
+
+
+class RomMap:
+    """Where each instruction of a program comes from."""
+
+    def __init__(
+        self,
+        asm_path: str,
+        asm_lines: array,
+        labels: dict[str, int],
+        symbols: dict[str, int],
+    ) -> None:
+        self.asm_path = asm_path
+        """The assembly file, as given to the assembler."""
+        self.asm_lines = asm_lines
+        """Line of the assembly file of each ROM address, as an `array('L')`."""
+        self.labels = labels
+        """ROM address of each label."""
+        self.symbols = symbols
+        """Value of every symbol, including predefined symbols and variables."""
+
+    @classmethod
+    def scan(cls, asm_path: str, lines: Iterable[str], symbols: SymbolTable):
+        """Create the map of a program from its lines of assembly and the
+        symbol table it was assembled with."""
+        asm_lines = array("L")
+        labels = {}
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            if line[0] == "(":
+                labels[line[1 : line.index(")")]] = len(asm_lines)
+            else:
+                asm_lines.append(line_no)
+        return cls(asm_path, asm_lines, labels, symbols.to_dict())
+
+    @classmethod
+    def scan_file(cls, asm_path: str, symbols: SymbolTable):
+        """Create the map of a `.asm` file, see `scan`."""
+        with open(asm_path, "rt", encoding="utf-8") as f:
+            return cls.scan(asm_path, f, symbols)
+
+    def write(self, map_path) -> None:
+        """Write the map to a file."""
+        with open(map_path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "asm": self.asm_path,
+                    "lines": self.asm_lines.tolist(),
+                    "labels": self.labels,
+                    "symbols": self.symbols,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def read(cls, map_path) -> "RomMap":
+        """Read a map written by `write`."""
+        with open(map_path, "rt", encoding="utf-8") as f:
+            stored = json.load(f)
+        return cls(
+            stored["asm"],
+            array("L", stored["lines"]),
+            stored["labels"],
+            stored["symbols"],
+        )
@@ -6,38 +6,45 @@ class SymbolTable:
     - Variable symbols are bound to consecutive RAM addresses starting at address 16.
     """
 
+    _PREDEFINED = {
+        "R0": 0,
+        "R1": 1,
+        "R2": 2,
+        "R3": 3,
+        "R4": 4,
+        "R5": 5,
+        "R6": 6,
+        "R7": 7,
+        "R8": 8,
+        "R9": 9,
+        "R10": 10,
+        "R11": 11,
+        "R12": 12,
+        "R13": 13,
+        "R14": 14,
+        "R15": 15,
+        "SP": 0,
+        "LCL": 1,
+        "ARG": 2,
+        "THIS": 3,
+        "THAT": 4,
+        "SCREEN": 16384,
+        "KBD": 24576,
+    }
+    """Symbols bound before any program is read, shared by every table."""
+
     def __init__(self) -> None:
         """Initializes symbol table with predefined symbols"""
-        self._dict = {
-            "R0": 0,
-            "R1": 1,
-            "R2": 2,
-            "R3": 3,
-            "R4": 4,
-            "R5": 5,
-            "R6": 6,
-            "R7": 7,
-            "R8": 8,
-            "R9": 9,
-            "R10": 10,
-            "R11": 11,
-            "R12": 12,
-            "R13": 13,
-            "R14": 14,
-            "R15": 15,
-            "SP": 0,
-            "LCL": 1,
-            "ARG": 2,
-            "THIS": 3,
-            "THAT": 4,
-            "SCREEN": 16384,
-            "KBD": 24576,
-        }
+        self._dict = dict(self._PREDEFINED)
 
     def add_symbol(self, symbol: str, address: int) -> None:
         """Add the pair (symbol, address) to the symbol table."""
         self._dict[symbol] = address
 
+    def __len__(self) -> int:
+        """Number of symbols in the table, including the predefined ones."""
+        return len(self._dict)
+
     def contains(self, symbol: str) -> bool:
         """Check if the symbol table contains the given symbol."""
         return symbol in self._dict
@@ -45,3 +52,14 @@ class SymbolTable:
     def get_bound_decimal(self, symbol: str) -> int:
         """Get the decimal value that a symbol is bound to."""
         return self._dict[symbol]
+
+    def to_dict(self) -> dict[str, int]:
+        """Return a copy of every (symbol, address) pair in the table."""
+        return dict(self._dict)
+
+    @classmethod
+    def from_dict(cls, symbols: dict[str, int]) -> "SymbolTable":
+        """Create a symbol table holding exactly the given pairs."""
+        table = cls()
+        table._dict = dict(symbols)
+        return table
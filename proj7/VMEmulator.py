@@ -0,0 +1,106 @@
+"""
+Runs Hack VM programs directly, without translating them.
+Usage: $py VMEmulator.py [path/to/]Prog.vm|dir [-n commands] [--dump 0:3 ...]
+    [--compare [--cycles N]]
+"""
+
+import argparse
+import time
+from pathlib import Path
+from code_writer import CodeWriter
+from vm_emulator import VMEmulator
+import VMTranslator
+
+_POINTERS_AND_TEMP = range(13)
+"""RAM addresses of SP, LCL, ARG, THIS, THAT and temp."""
+
+
+def _parse_range(text: str) -> range:
+    """Convert `start[:end]` into a range of RAM addresses."""
+    start, _, end = text.partition(":")
+    return range(int(start), int(end or start) + 1)
+
+
+def _run_translated(programs, max_cycles: int):
+    """Translate and assemble programs in memory, run the machine code and
+    return the Hack computer and the elapsed seconds of the run."""
+    VMTranslator._add_assembler_path()
+    from assembler import Assembler
+    from jit import JitHackComputer
+
+    writer = CodeWriter(None)
+    for fname, commands in programs.items():
+        writer.set_file_name(fname)
+        writer.write_commands(commands)
+    writer.close()
+    words = Assembler().assemble_lines(writer.take_lines())
+    computer = JitHackComputer(words)
+    start = time.perf_counter()
+    computer.run(max_cycles)
+    return computer, time.perf_counter() - start
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("source", type=Path, help="a .vm file or a directory")
+    arg_parser.add_argument(
+        "-n",
+        "--commands",
+        type=int,
+        default=10_000_000,
+        help="maximum number of VM commands to execute",
+    )
+    arg_parser.add_argument(
+        "--dump",
+        type=_parse_range,
+        action="append",
+        default=[],
+        metavar="START[:END]",
+        help="print RAM words after the run",
+    )
+    arg_parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="also run the translated program on the Hack JIT, check that the"
+        " pointers, temp, statics and dumped words match and report the speedup",
+    )
+    arg_parser.add_argument(
+        "--cycles",
+        type=int,
+        default=100_000_000,
+        help="maximum number of Hack instructions to execute with --compare",
+    )
+    args = arg_parser.parse_args()
+
+    programs = VMTranslator.parse_source(args.source)
+    emulator = VMEmulator(programs)
+    start = time.perf_counter()
+    emulator.run(args.commands)
+    elapsed = time.perf_counter() - start
+    status = "halted" if emulator.halted else "stopped"
+    executed = emulator.commands_executed
+    print(f"vm: {status} after {executed} commands in {elapsed:.3f}s", end="")
+    print(f" ({executed / elapsed / 1e6:.2f} M commands/s)" if elapsed else "")
+    dumped = [address for addresses in args.dump for address in addresses]
+    if args.compare:
+        computer, hack_elapsed = _run_translated(programs, args.cycles)
+        status = "halted" if computer.halted else "stopped"
+        print(f"hack: {status} after {computer.cycles} cycles in {hack_elapsed:.3f}s")
+        compared = [*_POINTERS_AND_TEMP, *emulator.statics.values(), *dumped]
+        differing = [a for a in compared if emulator.ram[a] != computer.ram[a]]
+        if differing:
+            raise SystemExit(
+                "RAM differs at "
+                + ", ".join(
+                    f"{a}: {emulator.ram[a]} != {computer.ram[a]}" for a in differing
+                )
+            )
+        print(f"RAM matches at {len(set(compared))} addresses")
+        if elapsed:
+            print(f"speedup: {hack_elapsed / elapsed:.1f}x")
+    for address in dumped:
+        print(f"RAM[{address}] = {emulator.ram[address]}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,42 +1,743 @@
+"""
+Translates Hack VM code into Hack assembly.
+Usage: $py VMTranslator.py [path/to/]Prog.vm|dir [--optimize-vm] [--emit-vm DIR]
+    [--drop-dead-functions] [--cache-tos] [--peephole] [-O 0|s|2] [--workers N]
+    [--hack] [--binary] [--no-asm] [--minify] [--map] [--cache-dir DIR]
+    [--watch [SECONDS]] [--profile-guide PROFILE_JSON [--rom-budget WORDS]]
+    [--stages] [--stages-json PATH]
+"""
+
+import argparse
 import sys
-from parser import Parser
-from code_writer import CodeWriter
+import time
+from collections import Counter
+from os import path
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from parser import Command, parse_file
 from command_type import CommandType
+from code_writer import (
+    OPTIMIZATION_LEVELS,
+    CachingCodeWriter,
+    CodeWriter,
+    output_path,
+    starts_with_label,
+)
+from emitter import AnnotatedEmitter, ListEmitter, MinifiedEmitter
+from source_map import MAP_SUFFIX, SourceMap
+from fragment_cache import Fragment, FragmentCache
+from profile_guide import ROM_WORDS, ProfileGuide
 from pathlib import Path
+import call_graph
+import peephole
+import vm_optimizer
+
+_ASSEMBLER_DIR = Path(__file__).resolve().parent.parent / "proj6"
+"""Where the Hack assembler is, for writing machine code directly."""
+
+
+def _add_assembler_path() -> None:
+    """Make the assembler's modules importable from its own directory, which
+    is searched after this one so that `parser` stays the VM parser."""
+    if str(_ASSEMBLER_DIR) not in sys.path:
+        sys.path.append(str(_ASSEMBLER_DIR))
+
+
+@dataclass(frozen=True)
+class TranslationOptions:
+    """How `translate` writes a program.
+
+    Raises:
+        ValueError: A guide is given at level 2, which writes every call,
+            return and comparison inline already.
+    """
+
+    optimize: bool = False
+    """Run the assembly through the `peephole` optimizer."""
+    optimize_vm: bool = False
+    """Run the commands of each file through `vm_optimizer`."""
+    emit_vm: Path | None = None
+    """Directory to write the commands that are translated to."""
+    cache_tos: bool = False
+    """Keep the top of stack in D, see `CachingCodeWriter`."""
+    level: str = "0"
+    """Optimization level of the `CodeWriter`."""
+    drop_dead_functions: bool = False
+    """Leave out the functions that cannot be called from `Sys.init`, see
+    `call_graph`."""
+    workers: int | None = None
+    """Translate each file on a pool of this many processes. The output is
+    the same as when translating serially."""
+    hack: bool = False
+    """Write the machine code to a `.hack` file."""
+    binary: bool = False
+    """Write the machine code to a packed `.bin` file."""
+    asm: bool = True
+    """Write the `.asm` file."""
+    minify: bool = False
+    """Write the `.asm` file without comments or indentation."""
+    source_map: bool = False
+    """Write the origin of each line of the `.asm` file, see `source_map`,
+    and the `.asm` line of each ROM address when the program is assembled,
+    see the assembler's `rom_map`. The maps are written even if the `.asm`
+    file is not."""
+    guide: ProfileGuide | None = None
+    """Execution counts of the commands, to write the hot calls, returns and
+    comparisons inline at level 0 or s, see `profile_guide`."""
+    rom_budget: int = ROM_WORDS
+    """Number of words the program must fit in with the hot commands
+    inline."""
+
+    def __post_init__(self) -> None:
+        if self.guide is not None and self.level == "2":
+            raise ValueError("A profile guide requires optimization level 0 or s")
+
+    def for_file(self) -> "TranslationOptions":
+        """Return the options that change how a file translates on its own,
+        which key its fragment and are passed to the workers, with the
+        others left at their defaults."""
+        return TranslationOptions(
+            optimize=self.optimize,
+            cache_tos=self.cache_tos,
+            level=self.level,
+            source_map=self.source_map,
+        )
+
+
+class TranslationReport:
+    """What the optimizers removed during a translation, and the result."""
+
+    def __init__(self) -> None:
+        self.vm_removed: dict[str, Counter[str]] = {}
+        """VM commands removed by each `vm_optimizer` rule, per function."""
+        self.asm_removed: Counter[str] = Counter()
+        """Instructions removed by each `peephole` pattern."""
+        self.rom_size = 0
+        """Number of instructions written."""
+        self.estimated_cycles: Counter[str] = Counter()
+        """See `CodeWriter.estimated_cycles`."""
+        self.dropped_functions: list[str] = []
+        """Functions left out because they cannot be called."""
+        self.dropped_words = 0
+        """Number of instructions the dropped functions translate to."""
+        self.words = None
+        """Machine code of the program, as an `array('L')`, when assembled."""
+        self.translated_files: list[str] = []
+        """Files translated, rather than taken from the fragment cache."""
+        self.hot_commands: set[tuple[str, int]] = set()
+        """Commands written inline by profile guidance, by file and line."""
 
-source = Path(sys.argv[1])
-parsers: dict[str, Parser] = {}
 
-if source.is_file():
-    parsers[source.stem] = Parser(source)
-elif source.is_dir():
-    for child in source.iterdir():
-        if child.suffix == ".vm":
-            parsers[child.stem] = Parser(child)
-else:
+class SourceFiles:
+    """The parsed VM files of a source, parsed again only once they change.
+
+    A file is considered changed when its modification time or size is.
+    """
+
+    def __init__(self, source: Path) -> None:
+        self._source = source
+        self._parsed: dict[str, tuple[tuple[int, int], list[Command]]] = {}
+        """Modification time and size, and commands, of each file."""
+        self.last_modified = 0.0
+        """Latest modification time of the files changed by the last update."""
+
+    def update(self) -> list[str]:
+        """Parse the files added or changed since the last update.
+
+        Returns:
+            list: The names of the files added, changed or removed.
+
+        Raises:
+            ValueError: A file could not be parsed.
+        """
+        changed = []
+        parsed = {}
+        for path in _vm_files(self._source):
+            stat = path.stat()
+            version = stat.st_mtime_ns, stat.st_size
+            entry = self._parsed.get(path.stem)
+            if entry is None or entry[0] != version:
+                try:
+                    entry = version, parse_file(path)
+                except (ValueError, IndexError) as e:
+                    raise ValueError(f"{path.name}: {e}") from e
+                changed.append(path.stem)
+                self.last_modified = max(self.last_modified, stat.st_mtime)
+            parsed[path.stem] = entry
+        removed = [fname for fname in self._parsed if fname not in parsed]
+        if removed:
+            self.last_modified = max(self.last_modified, time.time())
+        self._parsed = parsed
+        return changed + removed
+
+    def programs(self) -> dict[str, list[Command]]:
+        """Return the commands of each file, keyed by file stem in sorted order."""
+        return {fname: commands for fname, (_, commands) in self._parsed.items()}
+
+
+def parse_source(source: Path) -> dict[str, list[Command]]:
+    """Parse a VM file, or every VM file in a directory, keyed by file stem
+    in sorted order."""
+    return {path.stem: parse_file(path) for path in _vm_files(source)}
+
+
+def _vm_files(source: Path) -> list[Path]:
+    """Return source if it is a file, or the VM files it contains in sorted order."""
+    if source.is_file():
+        return [source]
+    if source.is_dir():
+        return [child for child in sorted(source.iterdir()) if child.suffix == ".vm"]
     raise ValueError("Input path is neither a file nor a directory")
 
-cw = CodeWriter(source)
-for fname, parser in parsers.items():
+
+def write_vm(directory: Path, programs: dict[str, list[Command]]) -> None:
+    """Write each program to a `.vm` file in directory, named by its key."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for fname, commands in programs.items():
+        with open(directory / f"{fname}.vm", "w") as f:
+            f.writelines(f"{command}\n" for command in commands)
+
+
+def translate(
+    source: Path,
+    options: TranslationOptions = TranslationOptions(),
+    programs: dict[str, list[Command]] | None = None,
+    fragments: FragmentCache | None = None,
+    instrumentation=None,
+) -> TranslationReport:
+    """Translate source into a single `.asm` file, see `CodeWriter`.
+
+    The program can also be assembled in process into a `.hack` file, a
+    packed `.bin` file or both, without reading back any assembly text.
+
+    Args:
+        source: A `.vm` file or a directory of them.
+        options: How to translate and what to write.
+        programs: The parsed files of source, which are read by default.
+        fragments: Where the assembly of each file is looked up before it is
+            translated, and stored after.
+        instrumentation: Where the time of each stage is recorded, with the
+            commands parsed by type, the instructions by type and symbols
+            when assembled, and the bytes written, if anywhere, see the
+            assembler's `instrumentation`.
+    """
+    _add_assembler_path()
+    from instrumentation import timed
+
+    report = TranslationReport()
+    if programs is None:
+        with timed(instrumentation, "parse"):
+            programs = parse_source(source)
+    else:
+        programs = dict(programs)
+    if instrumentation is not None:
+        instrumentation.count(
+            "commands",
+            (
+                command.command_type.name
+                for commands in programs.values()
+                for command in commands
+            ),
+        )
+    if options.optimize_vm:
+        with timed(instrumentation, "optimize vm"):
+            for fname, commands in programs.items():
+                programs[fname], removed = vm_optimizer.optimize(commands, fname)
+                report.vm_removed.update(removed)
+    dropped: dict[str, list[Command]] = {}
+    if options.drop_dead_functions:
+        with timed(instrumentation, "drop dead functions"):
+            programs, dropped = call_graph.eliminate_dead_functions(programs)
+    if options.emit_vm is not None:
+        with timed(instrumentation, "write"):
+            write_vm(options.emit_vm, programs)
+    writer_class = CachingCodeWriter if options.cache_tos else CodeWriter
+    emitter_class = MinifiedEmitter if options.minify else AnnotatedEmitter
+    asm_path = output_path(source, ".asm")
+    recorder = SourceMap(asm_path.name) if options.source_map else None
+    in_memory = options.hack or options.binary
+    if in_memory:
+        emitter = ListEmitter()
+    else:
+        emitter = emitter_class(
+            asm_path, source_map=recorder, instrumentation=instrumentation
+        )
+    hot_commands = None
+    if options.guide is not None:
+        with timed(instrumentation, "profile guide"):
+            hot_commands = report.hot_commands = options.guide.hot_commands(
+                programs,
+                writer_class,
+                options.level,
+                options.optimize,
+                options.rom_budget,
+            )
+    with timed(instrumentation, "translate"):
+        cw = writer_class(
+            None,
+            options.optimize,
+            options.level,
+            emitter=emitter,
+            source_map=options.source_map,
+            hot_commands=hot_commands,
+            instrumentation=instrumentation,
+        )
+        if options.workers or fragments is not None:
+            translated, report.translated_files = _translate_files(
+                options, programs, fragments, hot_commands
+            )
+            for i, fragment in enumerate(translated):
+                last = i + 1 == len(translated)
+                if fragment.optimized is not None and (
+                    last or starts_with_label(translated[i + 1].lines)
+                ):
+                    cw.write_fragment(
+                        fragment.optimized,
+                        fragment.estimated_cycles,
+                        fragment.peephole_removed,
+                    )
+                else:
+                    cw.write_fragment(fragment.lines, fragment.estimated_cycles)
+        else:
+            for fname, commands in programs.items():
+                cw.set_file_name(fname)
+                cw.write_commands(commands)
+            report.translated_files = list(programs)
+        for fname, commands in dropped.items():
+            cw.set_file_name(fname)
+            report.dropped_words += cw.count_instructions(commands)
+            report.dropped_functions += [
+                command.arg_1
+                for command in commands
+                if command.command_type is CommandType.C_FUNCTION
+            ]
+        cw.close()
+    if in_memory:
+        lines = emitter.take_lines()
+        if recorder is not None:
+            # The lines of the .asm file, which the ROM map refers to
+            lines = recorder.record(lines, not options.minify)
+        if options.asm:
+            text = emitter_class(asm_path, instrumentation=instrumentation)
+            text.emit(lines)
+            text.close()
+        report.words = _assemble(
+            lines,
+            source,
+            options.hack,
+            options.binary,
+            options.source_map,
+            instrumentation,
+        )
+    if recorder is not None:
+        with timed(instrumentation, "write"):
+            recorder.write(output_path(source, MAP_SUFFIX))
+    if instrumentation is not None:
+        instrumentation.totals["instructions written"] += cw.rom_size
+        written = [asm_path] if options.asm else []
+        if recorder is not None:
+            written.append(output_path(source, MAP_SUFFIX))
+        instrumentation.totals["bytes written"] += sum(map(path.getsize, written))
+    report.asm_removed = cw.peephole_removed
+    report.rom_size = cw.rom_size
+    report.estimated_cycles = cw.estimated_cycles
+    return report
+
+
+def _translate_files(
+    options: TranslationOptions,
+    programs: dict[str, list[Command]],
+    fragments: FragmentCache | None,
+    hot_commands: set[tuple[str, int]] | None = None,
+) -> tuple[list[Fragment], list[str]]:
+    """Translate each file of programs on its own, see `_translate_file`.
+
+    Fragments found in the cache are reused. The other files are translated
+    on a pool of `options.workers` processes, if given, and stored in the
+    cache. Both depend only on `TranslationOptions.for_file`.
+
+    Returns:
+        tuple: The fragment of each file, in order, and the names of the
+            files translated.
+    """
+    # Each file only needs to know which of its own commands are hot
+    hot: dict[str, set[tuple[str, int]] | None] = {
+        fname: None if hot_commands is None else set() for fname in programs
+    }
+    for fname, line_no in hot_commands or ():
+        hot[fname].add((fname, line_no))
+    file_options = options.for_file()
+    found: dict[str, Fragment] = {}
+    keys: dict[str, str] = {}
+    if fragments is not None:
+        for fname, commands in programs.items():
+            key_options = repr(file_options)
+            if hot[fname] is not None:
+                lines = sorted(line_no for _, line_no in hot[fname])
+                key_options = f"{key_options} {lines}"
+            keys[fname] = fragments.key(key_options, fname, commands)
+            if (fragment := fragments.get(fname, keys[fname])) is not None:
+                found[fname] = fragment
+    pending = [fname for fname in programs if fname not in found]
+    args = (
+        [file_options] * len(pending),
+        pending,
+        [programs[fname] for fname in pending],
+        [hot[fname] for fname in pending],
+    )
+    if options.workers:
+        with ProcessPoolExecutor(options.workers) as pool:
+            translated = list(pool.map(_translate_file, *args))
+    else:
+        translated = list(map(_translate_file, *args))
+    for fname, fragment in zip(pending, translated):
+        found[fname] = fragment
+        if fragments is not None:
+            fragments.put(fname, keys[fname], fragment)
+    return [found[fname] for fname in programs], pending
+
+
+def _translate_file(
+    options: TranslationOptions,
+    fname: str,
+    commands: list[Command],
+    hot_commands: set[tuple[str, int]] | None = None,
+) -> Fragment:
+    """Translate the commands of a file on their own.
+
+    If `options.optimize` and the assembly starts with a label, it is also
+    run through the peephole optimizer, see `CodeWriter.write_fragment`.
+    """
+    writer_class = CachingCodeWriter if options.cache_tos else CodeWriter
+    cw = writer_class(
+        None,
+        level=options.level,
+        bootstrap=False,
+        source_map=options.source_map,
+        hot_commands=hot_commands,
+    )
     cw.set_file_name(fname)
-    while parser.has_more_lines():
-        parser.advance()
-        command = parser.command_type()
-        match command:
-            case CommandType.C_ARITHMETIC:
-                cw.write_arithmetic(parser.arg_1())
-            case CommandType.C_CALL:
-                cw.write_call(parser.arg_1(), parser.arg_2())
-            case CommandType.C_FUNCTION:
-                cw.write_function(parser.arg_1(), parser.arg_2())
-            case CommandType.C_GOTO:
-                cw.write_goto(parser.arg_1())
-            case CommandType.C_IF:
-                cw.write_if(parser.arg_1())
-            case CommandType.C_LABEL:
-                cw.write_label(parser.arg_1())
-            case CommandType.C_PUSH | CommandType.C_POP:
-                cw.write_push_pop(command, parser.arg_1(), parser.arg_2())
-            case CommandType.C_RETURN:
-                cw.write_return()
-cw.close()
+    cw.write_commands(commands)
+    fragment = Fragment(cw.take_lines(), cw.estimated_cycles)
+    if options.optimize and starts_with_label(fragment.lines):
+        fragment.optimized, fragment.peephole_removed = peephole.optimize(
+            fragment.lines
+        )
+    return fragment
+
+
+def _assemble(
+    lines: list[str],
+    source: Path,
+    hack: bool,
+    binary: bool,
+    rom_map: bool,
+    instrumentation=None,
+):
+    """Assemble lines with the Hack assembler and write the machine code of
+    source, and its ROM map if rom_map, to the requested files.
+
+    The assembler's modules are imported from its own directory, see
+    `_add_assembler_path`.
+    """
+    _add_assembler_path()
+    import hack_file
+    from assembler import Assembler
+    from instrumentation import timed
+    from rom_map import MAP_SUFFIX as ROM_MAP_SUFFIX, RomMap
+
+    assembler = Assembler()
+    with timed(instrumentation, "assemble"):
+        words = assembler.assemble_lines(lines)
+    written = []
+    with timed(instrumentation, "write"):
+        if hack:
+            written.append(output_path(source, ".hack"))
+            hack_file.write_hack(written[-1], words)
+        if binary:
+            written.append(output_path(source, hack_file.PACKED_SUFFIX))
+            hack_file.write_packed(written[-1], words)
+    if rom_map:
+        asm_name = output_path(source, ".asm").name
+        written.append(output_path(source, ROM_MAP_SUFFIX))
+        with timed(instrumentation, "map"):
+            RomMap.scan(asm_name, lines, assembler.symbols).write(written[-1])
+    if instrumentation is not None:
+        labels = sum(1 for line in lines if line.startswith("("))
+        instrumentation.count_instructions(words, labels)
+        instrumentation.totals["symbols"] += len(assembler.symbols)
+        instrumentation.totals["bytes written"] += sum(map(path.getsize, written))
+    return words
+
+
+def watch(
+    source: Path,
+    options: TranslationOptions = TranslationOptions(),
+    interval: float = 0.5,
+    cache_dir: Path | None = None,
+) -> None:
+    """Translate source, then again whenever its files change, until
+    interrupted.
+
+    Only the files whose commands to translate changed are translated again,
+    see `FragmentCache`, and the whole program is then written from the
+    fragments. The latency from the edit to the rebuilt output is reported
+    on stderr.
+
+    Args:
+        source: A `.vm` file or a directory of them.
+        options: How to translate and what to write, see `translate`.
+        interval: Seconds between checks for changes.
+        cache_dir: Where fragments are also kept, so that they survive a
+            restart.
+    """
+    files = SourceFiles(source)
+    fragments = FragmentCache(cache_dir)
+    first = True
+    error = None
+    while True:
+        try:
+            changed = files.update()
+            if changed:
+                start = time.perf_counter()
+                programs = files.programs()
+                report = translate(source, options, programs, fragments)
+                built = time.perf_counter() - start
+                message = (
+                    f"translated {len(report.translated_files)} of "
+                    f"{len(programs)} files and wrote {report.rom_size} words in "
+                    f"{built * 1000:.0f} ms"
+                )
+                if not first:
+                    latency = time.time() - files.last_modified
+                    message = (
+                        f"{', '.join(changed)} changed: {message}, "
+                        f"{latency * 1000:.0f} ms after the edit"
+                    )
+                print(message, file=sys.stderr)
+                first = False
+                error = None
+        except (OSError, ValueError) as e:
+            # Most likely a file caught in the middle of being saved
+            if str(e) != error:
+                error = str(e)
+                print(f"error: {error}", file=sys.stderr)
+        time.sleep(interval)
+
+
+def _print_removed(removed: Counter[str], names, label: str) -> None:
+    """Print the nonzero counts of removed, in the order of names, to stderr."""
+    counts = ", ".join(f"{name} {removed[name]}" for name in names if removed[name])
+    print(f"{label}: {counts or 'nothing'} removed", file=sys.stderr)
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("source", type=Path, help="a .vm file or a directory")
+    arg_parser.add_argument(
+        "--optimize-vm",
+        action="store_true",
+        help="simplify the VM commands and report them per function on stderr",
+    )
+    arg_parser.add_argument(
+        "--emit-vm",
+        type=Path,
+        metavar="DIR",
+        help="write the VM commands that are translated to DIR",
+    )
+    arg_parser.add_argument(
+        "--drop-dead-functions",
+        action="store_true",
+        help="leave out the functions that cannot be called from Sys.init",
+    )
+    arg_parser.add_argument(
+        "--cache-tos",
+        action="store_true",
+        help="keep the top of stack in the D register between commands",
+    )
+    arg_parser.add_argument(
+        "--peephole",
+        action="store_true",
+        help="remove redundant instructions and report them on stderr",
+    )
+    arg_parser.add_argument(
+        "-O",
+        dest="level",
+        choices=OPTIMIZATION_LEVELS,
+        help="inline calls, returns and comparisons (2) or not (0, s), and pick"
+        " the smallest (s) or fastest (2) local variable initialization;"
+        " reports the ROM size and estimated cycles on stderr",
+    )
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help="translate the files on N processes",
+    )
+    arg_parser.add_argument(
+        "--hack",
+        action="store_true",
+        help="also assemble the program into a .hack file, in process",
+    )
+    arg_parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="also assemble the program into a packed .bin file, in process",
+    )
+    arg_parser.add_argument(
+        "--no-asm",
+        dest="asm",
+        action="store_false",
+        help="do not write the .asm file, with --hack or --binary",
+    )
+    arg_parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="write the .asm file without comments or indentation",
+    )
+    arg_parser.add_argument(
+        "--map",
+        action="store_true",
+        help=f"write the VM file, function and line of each .asm line to a"
+        f" {MAP_SUFFIX} file, and with --hack or --binary the .asm line of each"
+        " ROM address to a .hack.map file",
+    )
+    arg_parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        metavar="DIR",
+        help="reuse the assembly of files translated before from DIR",
+    )
+    arg_parser.add_argument(
+        "--watch",
+        type=float,
+        nargs="?",
+        const=0.5,
+        metavar="SECONDS",
+        help="translate again whenever a file changes, checking every SECONDS"
+        " (0.5 by default), and report the latency on stderr",
+    )
+    arg_parser.add_argument(
+        "--profile-guide",
+        type=Path,
+        metavar="PROFILE_JSON",
+        help="write the calls, returns and comparisons that ran most often in a"
+        " profile written by the CPU emulator inline, using the source map of"
+        " the profiled build",
+    )
+    arg_parser.add_argument(
+        "--rom-budget",
+        type=int,
+        default=ROM_WORDS,
+        metavar="WORDS",
+        help=f"ROM size to stay within with --profile-guide ({ROM_WORDS} by default)",
+    )
+    arg_parser.add_argument(
+        "--stages",
+        action="store_true",
+        help="report the time of each stage, the commands and instructions by"
+        " type, the symbols and the bytes written on stderr",
+    )
+    arg_parser.add_argument(
+        "--stages-json",
+        type=Path,
+        metavar="PATH",
+        help="like --stages, also writing the report to a JSON file",
+    )
+    args = arg_parser.parse_args()
+    if not args.asm and not (args.hack or args.binary):
+        arg_parser.error("--no-asm requires --hack or --binary")
+    stages_requested = args.stages or args.stages_json is not None
+    if stages_requested and args.watch is not None:
+        arg_parser.error("--stages is not supported with --watch")
+    if args.stages_json is not None and args.stages_json.suffix in (".vm", ".asm"):
+        arg_parser.error("--stages-json would overwrite a .vm or .asm file")
+    guide = None
+    if args.profile_guide is not None:
+        # The map of the profiled build, read before it is written again
+        map_path = output_path(args.source, MAP_SUFFIX)
+        if not map_path.exists():
+            arg_parser.error(f"--profile-guide requires {map_path.name}, see --map")
+        guide = ProfileGuide.read(args.profile_guide, map_path)
+    try:
+        options = TranslationOptions(
+            optimize=args.peephole,
+            optimize_vm=args.optimize_vm,
+            emit_vm=args.emit_vm,
+            cache_tos=args.cache_tos,
+            level=args.level or "0",
+            drop_dead_functions=args.drop_dead_functions,
+            workers=args.workers,
+            hack=args.hack,
+            binary=args.binary,
+            asm=args.asm,
+            minify=args.minify,
+            source_map=args.map,
+            guide=guide,
+            rom_budget=args.rom_budget,
+        )
+    except ValueError as e:
+        arg_parser.error(str(e))
+    if args.watch is not None:
+        try:
+            watch(args.source, options, args.watch, args.cache_dir)
+        except KeyboardInterrupt:
+            pass
+        return
+    fragments = None if args.cache_dir is None else FragmentCache(args.cache_dir)
+    stages = None
+    if stages_requested:
+        _add_assembler_path()
+        from instrumentation import Instrumentation
+
+        stages = Instrumentation()
+    try:
+        report = translate(
+            args.source, options, fragments=fragments, instrumentation=stages
+        )
+    except ValueError as e:
+        arg_parser.error(str(e))
+    if fragments is not None:
+        print(
+            f"cache: {fragments.hits} hits, {fragments.misses} misses",
+            file=sys.stderr,
+        )
+    if args.optimize_vm:
+        total: Counter[str] = Counter()
+        for function, removed in report.vm_removed.items():
+            _print_removed(removed, vm_optimizer.RULES, function)
+            total += removed
+        _print_removed(total, vm_optimizer.RULES, "VM commands")
+    if args.peephole:
+        _print_removed(report.asm_removed, peephole.PATTERNS, "instructions")
+    if args.drop_dead_functions:
+        print(
+            f"dropped {len(report.dropped_functions)} functions, "
+            f"{report.dropped_words} words",
+            *report.dropped_functions,
+            sep="\n",
+            file=sys.stderr,
+        )
+    if guide is not None:
+        print(
+            f"profile guide: {len(report.hot_commands)} commands inline, "
+            f"ROM: {report.rom_size} of {args.rom_budget} words",
+            file=sys.stderr,
+        )
+    if args.level is not None:
+        cycles = report.estimated_cycles
+        print(f"ROM: {report.rom_size} words", file=sys.stderr)
+        print(
+            f"estimated cycles, each command once: {cycles.total()} ("
+            + ", ".join(f"{kind} {n}" for kind, n in sorted(cycles.items()) if n)
+            + ")",
+            file=sys.stderr,
+        )
+    if stages is not None:
+        stages.print_summary()
+        if args.stages_json is not None:
+            stages.write(args.stages_json)
+
+
+if __name__ == "__main__":
+    _main()
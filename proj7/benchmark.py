@@ -0,0 +1,214 @@
+"""
+Measures VM translation on large generated multi-file programs.
+Usage: $py benchmark.py [--files 40] [--functions 50] [--repeat 3]
+    [--guided [--source DIR] [--rom-budget WORDS] [--cycles N]]
+"""
+
+import argparse
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from parser import Parser, parse_file
+from code_writer import output_path
+from command_type import CommandType
+from profile_guide import ROM_WORDS, ProfileGuide
+from source_map import MAP_SUFFIX, SourceMap
+import VMTranslator
+
+
+_HOT_ITERATIONS = 1000
+"""Number of times the hot functions of a generated program loop."""
+
+
+def _function_source(class_name: str, index: int, body_ops: int) -> list[str]:
+    """Return a function that sums a decreasing counter plus some arithmetic."""
+    name = f"{class_name}.f{index}"
+    lines = [
+        f"function {name} 2",
+        "push argument 0",
+        "pop local 0",
+        "push constant 0",
+        "pop local 1",
+        "label LOOP",
+        "push local 0",
+        "push constant 0",
+        "eq",
+        "if-goto END",
+        "push local 1",
+    ]
+    for op in range(body_ops):
+        lines += [
+            f"push constant {op % 100}",
+            ("add", "sub", "and", "or")[op % 4],
+            f"push static {op % 8}",
+            "add",
+        ]
+    lines += [
+        "push local 0",
+        "add",
+        "pop local 1",
+        "push local 0",
+        "push constant 1",
+        "sub",
+        "pop local 0",
+        "goto LOOP",
+        "label END",
+        "push local 1",
+        "return",
+    ]
+    return lines
+
+
+def generate_program(
+    directory: Path, n_files: int, n_functions: int, body_ops=8, hot_functions=0
+):
+    """Write a program of n_files classes with n_functions functions each.
+
+    `Sys.init` calls `run` in every class, which calls each function of
+    its class once, and then loops forever. Each function loops 1 to 5
+    times, except for the first hot_functions of each class, which loop
+    `_HOT_ITERATIONS` times.
+    """
+    sys_lines = ["function Sys.init 0"]
+    for i in range(n_files):
+        class_name = f"Class{i}"
+        lines = []
+        run = [f"function {class_name}.run 0"]
+        for j in range(n_functions):
+            lines += _function_source(class_name, j, body_ops)
+            iterations = _HOT_ITERATIONS if j < hot_functions else j % 5 + 1
+            run += [f"push constant {iterations}", f"call {class_name}.f{j} 1"]
+            run += ["pop temp 0"]
+        run += ["push constant 0", "return"]
+        (directory / f"{class_name}.vm").write_text("\n".join(lines + run) + "\n")
+        sys_lines += [f"call {class_name}.run 0", "pop temp 0"]
+    sys_lines += ["label HALT", "goto HALT"]
+    (directory / "Sys.vm").write_text("\n".join(sys_lines) + "\n")
+
+
+def _parse_with_parser(vm_paths: list[Path]) -> int:
+    """Read every command through the `Parser` accessors, as before the IR."""
+    n_commands = 0
+    for vm_path in vm_paths:
+        parser = Parser(vm_path)
+        while parser.has_more_lines():
+            parser.advance()
+            command = parser.command_type()
+            if command is not CommandType.C_RETURN:
+                parser.arg_1()
+            if command in (
+                CommandType.C_PUSH,
+                CommandType.C_POP,
+                CommandType.C_FUNCTION,
+                CommandType.C_CALL,
+            ):
+                parser.arg_2()
+            n_commands += 1
+    return n_commands
+
+
+def _parse_to_ir(vm_paths: list[Path]) -> int:
+    return sum(len(parse_file(vm_path)) for vm_path in vm_paths)
+
+
+def _best_time(repeat: int, function, *args) -> float:
+    """Return the shortest of repeat runs of function(*args) in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _compare_guided(source: Path, rom_budget: int, max_cycles: int) -> None:
+    """Profile the program at level 0, then print the ROM words and executed
+    cycles of the level 0, profile-guided and level 2 builds."""
+    VMTranslator._add_assembler_path()
+    from jit import JitHackComputer
+    from profiler import ProfilingHackComputer
+    from rom_map import MAP_SUFFIX as ROM_MAP_SUFFIX, RomMap
+
+    unguided = VMTranslator.translate(
+        source, VMTranslator.TranslationOptions(hack=True, asm=False, source_map=True)
+    )
+    rom_map = RomMap.read(output_path(source, ROM_MAP_SUFFIX))
+    profiled = ProfilingHackComputer(array("H", unguided.words), rom_map.labels)
+    profiled.run(max_cycles)
+    guide = ProfileGuide.from_profile(
+        profiled.profile(rom_map.asm_lines),
+        SourceMap.read(output_path(source, MAP_SUFFIX)),
+    )
+    builds = {
+        "-O 0": unguided,
+        "guided": VMTranslator.translate(
+            source,
+            VMTranslator.TranslationOptions(
+                hack=True, asm=False, guide=guide, rom_budget=rom_budget
+            ),
+        ),
+        "-O 2": VMTranslator.translate(
+            source, VMTranslator.TranslationOptions(level="2", hack=True, asm=False)
+        ),
+    }
+    for name, report in builds.items():
+        computer = JitHackComputer(array("H", report.words))
+        computer.run(max_cycles)
+        status = "halted" if computer.halted else "stopped"
+        change = computer.cycles / profiled.cycles - 1
+        print(
+            f"{name}: {report.rom_size} words, {status} after {computer.cycles}"
+            f" cycles ({change:+.1%})"
+        )
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    arg_parser.add_argument("--files", type=int, default=40)
+    arg_parser.add_argument("--functions", type=int, default=50)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument(
+        "--guided",
+        action="store_true",
+        help="compare the cycles of profile-guided builds instead of timing",
+    )
+    arg_parser.add_argument(
+        "--source",
+        type=Path,
+        help="a program to compare with --guided instead of a generated one",
+    )
+    arg_parser.add_argument("--rom-budget", type=int, default=ROM_WORDS)
+    arg_parser.add_argument("--cycles", type=int, default=100_000_000)
+    args = arg_parser.parse_args()
+    if args.guided and args.source is not None:
+        _compare_guided(args.source, args.rom_budget, args.cycles)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "Bench"
+        source.mkdir()
+        hot_functions = 1 if args.guided else 0
+        generate_program(
+            source, args.files, args.functions, hot_functions=hot_functions
+        )
+        vm_paths = sorted(source.glob("*.vm"))
+        if args.guided:
+            _compare_guided(source, args.rom_budget, args.cycles)
+            return
+        n_commands = _parse_to_ir(vm_paths)
+        print(f"{len(vm_paths)} files, {n_commands} commands")
+
+        parser_time = _best_time(args.repeat, _parse_with_parser, vm_paths)
+        ir_time = _best_time(args.repeat, _parse_to_ir, vm_paths)
+        print(f"parse, Parser accessors: {parser_time:.3f}s")
+        print(f"parse, IR: {ir_time:.3f}s ({parser_time / ir_time:.1f}x)")
+        translate_time = _best_time(args.repeat, VMTranslator.translate, source)
+        print(
+            f"translate: {translate_time:.3f}s, "
+            f"{n_commands / translate_time:,.0f} commands/s"
+        )
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,298 @@
+"""
+Benchmarks the assembler and the VM translator over a corpus of programs.
+Usage: $py benchmark_suite.py run [-o results.json] [--repeat 3] [--asm-mb 1]
+    [--files 40] [--functions 50] [--cycles N]
+    $py benchmark_suite.py compare baseline.json results.json
+    [--seconds 0.2] [--peak-rss 0.2] [--rom-words 0] [--cycles 0]
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from benchmark import generate_program
+from code_writer import output_path
+from profile_guide import ROM_WORDS
+import VMTranslator
+
+try:
+    import resource  # noqa: F401, Unavailable on Windows
+
+    _measure_rss = True
+except ImportError:
+    _measure_rss = False
+
+_HERE = Path(__file__).resolve().parent
+_ASSEMBLER = VMTranslator._ASSEMBLER_DIR / "HackAssembler.py"
+_TRANSLATOR = _HERE / "VMTranslator.py"
+_ASSEMBLY_PROGRAMS = [
+    _HERE.parent / "proj4" / name / f"{name}.asm" for name in ("Fill", "Mult")
+]
+"""The hand-written programs of project 4."""
+_PEAK_RSS_WRAPPER = """
+import resource, subprocess, sys
+subprocess.run(sys.argv[1:], check=True, stdout=subprocess.DEVNULL)
+print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+"""
+"""Runs a command and prints its peak resident set size in KiB."""
+
+THRESHOLDS = {"seconds": 0.2, "peak_rss_kib": 0.2, "rom_words": 0.0, "cycles": 0.0}
+"""Default fraction by which each metric may grow before it is a regression."""
+
+
+def _generate_asm(size_bytes: int) -> str:
+    """Return generated assembly, see the assembler's `benchmark.generate_asm`."""
+    # Loaded by path, as this directory has a `benchmark` module too
+    spec = importlib.util.spec_from_file_location(
+        "asm_benchmark", VMTranslator._ASSEMBLER_DIR / "benchmark.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.generate_asm(size_bytes)
+
+
+def build_corpus(
+    directory: Path, asm_bytes: int, n_files: int, n_functions: int
+) -> dict[str, Path]:
+    """Write the programs to benchmark to directory.
+
+    The corpus has the project 4 programs and a generated `.asm` file of
+    about asm_bytes bytes, which are assembled, and two generated multi-file
+    VM programs, which are translated: a small one with a hot loop in each
+    class, which fits in the ROM, and one of n_files classes with
+    n_functions functions each.
+
+    Returns:
+        dict: The `.asm` file or VM directory of each benchmark, by name.
+    """
+    corpus = {}
+    for asm_path in _ASSEMBLY_PROGRAMS:
+        corpus[asm_path.stem] = Path(shutil.copy(asm_path, directory))
+    corpus["generated-asm"] = directory / "Generated.asm"
+    corpus["generated-asm"].write_text(_generate_asm(asm_bytes), encoding="utf-8")
+    for name, n_files, n_functions, hot_functions in (
+        ("small-vm", 4, 8, 1),
+        ("large-vm", n_files, n_functions, 0),
+    ):
+        corpus[name] = directory / name.title().replace("-", "")
+        corpus[name].mkdir()
+        generate_program(
+            corpus[name], n_files, n_functions, hot_functions=hot_functions
+        )
+    return corpus
+
+
+def _count_lines(source: Path) -> int:
+    """Return the number of lines of a `.asm` file or of the `.vm` files of a
+    directory."""
+    paths = sorted(source.glob("*.vm")) if source.is_dir() else [source]
+    n_lines = 0
+    for fpath in paths:
+        with open(fpath, "rb") as f:
+            n_lines += sum(1 for _ in f)
+    return n_lines
+
+
+def _run_tool(script: Path, *args) -> tuple[float, int | None]:
+    """Run the assembler or the translator with args.
+
+    Returns:
+        tuple: The elapsed seconds and the peak resident set size in KiB
+            (None where it cannot be measured).
+    """
+    command = [sys.executable, str(script), *map(str, args)]
+    if _measure_rss:
+        command = [sys.executable, "-c", _PEAK_RSS_WRAPPER, *command]
+    start = time.perf_counter()
+    result = subprocess.run(
+        command,
+        check=True,
+        stdout=subprocess.PIPE if _measure_rss else subprocess.DEVNULL,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, int(result.stdout) if _measure_rss else None
+
+
+def _executed_cycles(hack_path: Path, max_cycles: int) -> int | None:
+    """Run a program on the JIT and return the number of cycles it took to
+    halt, or None if it did not halt in time."""
+    VMTranslator._add_assembler_path()
+    import hack_file
+    from jit import JitHackComputer
+
+    computer = JitHackComputer(hack_file.load_rom(hack_path))
+    computer.run(max_cycles)
+    return computer.cycles if computer.halted else None
+
+
+def run_suite(corpus: dict[str, Path], repeat: int, max_cycles: int) -> dict:
+    """Benchmark each program of corpus, see `build_corpus`.
+
+    `.asm` files are assembled with `HackAssembler.py` and directories are
+    translated and assembled with `VMTranslator.py --hack`, in a new process
+    each time, repeat times. The `.hack` file is then run on the JIT for up
+    to max_cycles.
+
+    Returns:
+        dict: For each benchmark, by name, the tool, the number of source
+            lines, the best wall time in seconds, the lines per second, the
+            largest peak resident set size in KiB, the number of ROM words
+            and the number of cycles executed until the program halted, with
+            None for the measures that are not available, such as the cycles
+            of a program that does not fit in the ROM.
+    """
+    results = {}
+    for name, source in corpus.items():
+        if source.is_dir():
+            tool, command = "translator", [_TRANSLATOR, source, "--hack"]
+        else:
+            tool, command = "assembler", [_ASSEMBLER, source]
+        runs = [_run_tool(*command) for _ in range(repeat)]
+        hack_path = output_path(source, ".hack")
+        with open(hack_path, "rb") as f:
+            rom_words = sum(1 for line in f if line.strip())
+        seconds = min(elapsed for elapsed, _ in runs)
+        peaks = [peak for _, peak in runs if peak is not None]
+        n_lines = _count_lines(source)
+        results[name] = {
+            "tool": tool,
+            "lines": n_lines,
+            "seconds": round(seconds, 4),
+            "lines_per_second": round(n_lines / seconds),
+            "peak_rss_kib": max(peaks) if peaks else None,
+            "rom_words": rom_words,
+            "cycles": (
+                _executed_cycles(hack_path, max_cycles)
+                if rom_words <= ROM_WORDS
+                else None
+            ),
+        }
+    return results
+
+
+def compare(baseline: dict, results: dict, thresholds: dict[str, float]) -> list[str]:
+    """Compare the results of two runs of the suite, see `run_suite`.
+
+    Args:
+        baseline: The results to compare against.
+        results: The new results.
+        thresholds: Fraction by which each metric, by name, may grow.
+
+    Returns:
+        list: A description of each regression: a metric that grew past its
+            threshold, or a benchmark of baseline that is missing or whose
+            source has a different number of lines in results.
+    """
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None:
+            regressions.append(f"{name}: missing")
+            continue
+        if new["lines"] != old["lines"]:
+            regressions.append(
+                f"{name}: {new['lines']} source lines, baseline has {old['lines']}"
+            )
+            continue
+        for metric, threshold in thresholds.items():
+            if old[metric] is None or new[metric] is None:
+                continue
+            if new[metric] > old[metric] * (1 + threshold):
+                change = new[metric] / old[metric] - 1 if old[metric] else 1.0
+                regressions.append(
+                    f"{name}: {metric} {old[metric]} -> {new[metric]}"
+                    f" ({change:+.1%}, threshold {threshold:+.0%})"
+                )
+    return regressions
+
+
+def _print_result(name: str, result: dict) -> None:
+    print(
+        f"{name:>13}: {result['seconds']:.3f}s,"
+        f" {result['lines_per_second']:,} lines/s",
+        end="",
+    )
+    if result["peak_rss_kib"] is not None:
+        print(f", peak RSS {result['peak_rss_kib'] / 1024:.1f} MiB", end="")
+    print(f", {result['rom_words']} words", end="")
+    print(f", {result['cycles']} cycles" if result["cycles"] is not None else "")
+
+
+def _main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="benchmark the corpus")
+    run_parser.add_argument(
+        "-o", "--output", type=Path, help="write the results to a JSON file"
+    )
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument(
+        "--asm-mb", type=float, default=1, help="size of the generated .asm file"
+    )
+    run_parser.add_argument(
+        "--files", type=int, default=40, help="classes of the large VM program"
+    )
+    run_parser.add_argument(
+        "--functions", type=int, default=50, help="functions of each class"
+    )
+    run_parser.add_argument(
+        "--cycles",
+        type=int,
+        default=10_000_000,
+        help="maximum number of instructions to execute of each program",
+    )
+    compare_parser = commands.add_parser(
+        "compare", help="fail if results regressed from a baseline"
+    )
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("results", type=Path)
+    for metric, threshold in THRESHOLDS.items():
+        option = metric.removesuffix("_kib").replace("_", "-")
+        compare_parser.add_argument(
+            f"--{option}",
+            dest=metric,
+            type=float,
+            default=threshold,
+            metavar="FRACTION",
+            help=f"allowed growth of {metric} ({threshold} by default)",
+        )
+    args = arg_parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline, "rt", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.results, "rt", encoding="utf-8") as f:
+            results = json.load(f)
+        thresholds = {metric: getattr(args, metric) for metric in THRESHOLDS}
+        regressions = compare(baseline["results"], results["results"], thresholds)
+        if regressions:
+            raise SystemExit("Regressions:\n" + "\n".join(regressions))
+        print(f"No regressions in {len(baseline['results'])} benchmarks")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = build_corpus(
+            Path(tmp), int(args.asm_mb * 2**20), args.files, args.functions
+        )
+        results = run_suite(corpus, args.repeat, args.cycles)
+    for name, result in results.items():
+        _print_result(name, result)
+    if args.output is not None:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.output, "wt", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,85 @@
+"""Whole-program call graph of parsed VM files.
+
+A function extends from its `function` command to the next one or the end
+of its file. Calls name their callee directly, so the functions a program
+can run are exactly those reachable from the entry point through `call`
+commands.
+"""
+
+from collections.abc import Iterator
+from command_type import CommandType
+from parser import Command
+
+ENTRY_POINT = "Sys.init"
+"""Function called by the bootstrap code."""
+
+
+def split_functions(
+    commands: list[Command],
+) -> Iterator[tuple[str | None, list[Command]]]:
+    """Yield the name and commands of each function in a file.
+
+    Commands before the first function are yielded with the name None.
+    """
+    name = None
+    start = 0
+    for i, command in enumerate(commands):
+        if command.command_type is CommandType.C_FUNCTION:
+            if i > start:
+                yield name, commands[start:i]
+            name = command.arg_1
+            start = i
+    if len(commands) > start:
+        yield name, commands[start:]
+
+
+def build_call_graph(programs: dict[str, list[Command]]) -> dict[str, set[str]]:
+    """Return the functions called by each function defined in programs."""
+    graph: dict[str, set[str]] = {}
+    for commands in programs.values():
+        for name, body in split_functions(commands):
+            if name is not None:
+                graph[name] = {
+                    command.arg_1
+                    for command in body
+                    if command.command_type is CommandType.C_CALL
+                }
+    return graph
+
+
+def reachable_functions(graph: dict[str, set[str]], entry=ENTRY_POINT) -> set[str]:
+    """Return the functions that can be called, directly or not, from entry."""
+    reachable = {entry}
+    pending = [entry]
+    while pending:
+        for callee in graph.get(pending.pop(), ()):
+            if callee not in reachable:
+                reachable.add(callee)
+                pending.append(callee)
+    return reachable
+
+
+def eliminate_dead_functions(
+    programs: dict[str, list[Command]], entry=ENTRY_POINT
+) -> tuple[dict[str, list[Command]], dict[str, list[Command]]]:
+    """Split programs into the functions reachable from entry and the rest.
+
+    Commands outside of functions are kept.
+
+    Returns:
+        tuple: The commands kept and the commands dropped, keyed by file.
+    """
+    graph = build_call_graph(programs)
+    if entry not in graph:
+        raise ValueError(f"Entry point {entry} is not defined")
+    reachable = reachable_functions(graph, entry)
+    kept: dict[str, list[Command]] = {}
+    dropped: dict[str, list[Command]] = {}
+    for fname, commands in programs.items():
+        kept[fname], dropped[fname] = [], []
+        for name, body in split_functions(commands):
+            if name is None or name in reachable:
+                kept[fname] += body
+            else:
+                dropped[fname] += body
+    return kept, {fname: body for fname, body in dropped.items() if body}
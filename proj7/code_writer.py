@@ -1,6 +1,12 @@
+from collections import Counter
+from collections.abc import Collection, Iterable
 from pathlib import Path
 from typing import Literal
 from command_type import CommandType
+from emitter import AnnotatedEmitter, Emitter, ListEmitter
+from parser import Command
+from source_map import MAP_SUFFIX, SourceMap, origin_marker
+import peephole
 
 _POP_TOP_OF_STACK_TO_D = ("@SP", "AM=M-1", "D=M")
 """Pops top of stack to D, decrements SP; destroys A register"""
@@ -22,51 +28,149 @@ _UPDATE_FRAME_POINTER = "@R13", "AM=M-1", "D=M"
 """Decrements frame pointer, goes to register, stores value in D"""
 _PUSH_D_TO_STACK = "@SP", "AM=M+1", "A=A-1", "M=D"
 """Push D to top of stack and increments SP; destroys A"""
+_CACHED_ARITHMETIC_ASM_MAP = {
+    "add": "D=D+M",
+    "sub": "D=M-D",
+    "and": "D=D&M",
+    "or": "D=D|M",
+    "neg": "D=-D",
+    "not": "D=!D",
+}
+"""Computes into D from the cached top of stack in D and, if binary, the
+value below it in M"""
+_OPERATORS = {"add": "+", "sub": "-", "and": "&", "or": "|"}
+OPTIMIZATION_LEVELS = ("0", "s", "2")
+"""Levels of `CodeWriter`: 0 writes shared snippets and unrolled prologues,
+s writes the smallest code and 2 the fastest."""
 
 
 class CodeWriter:
     """Maps VM commands to Hack machine language."""
 
-    def __init__(self, fpath: Path) -> None:
+    def __init__(
+        self,
+        fpath: Path | None,
+        optimize: bool = False,
+        level: str = "0",
+        bootstrap: bool = True,
+        emitter: Emitter | None = None,
+        source_map: bool = False,
+        hot_commands: Collection[tuple[str, int]] | None = None,
+        instrumentation=None,
+    ) -> None:
         """Open output file and gets read to write into it.
 
         Args:
-            fpath: path to a single vm file or a folder containing VM files
+            fpath: path to a single vm file or a folder containing VM files,
+                whose `.asm` file is written by an `AnnotatedEmitter`, or
+                None to write to emitter
+            optimize: Hold the assembly until `close` and run it through the
+                peephole optimizer first.
+            level: One of `OPTIMIZATION_LEVELS`. At level 2, calls, returns
+                and comparisons are written inline instead of jumping to
+                shared snippets. The code that zeroes local variables is
+                picked for size at level s and for speed at level 2.
+            bootstrap: Start with the bootstrap code and the shared snippets.
+                Writers without bootstrap translate fragments of a program
+                into memory, see `write_fragment`.
+            emitter: Where the assembly goes when fpath is None. By default
+                it is kept in memory, see `take_lines`.
+            source_map: Write an origin marker before each command, see
+                `source_map`. With fpath, the map of the `.asm` file is
+                written next to it on `close`.
+            hot_commands: File name and line of the calls, returns and
+                comparisons to write inline, as at level 2, while the others
+                jump to the shared snippets, see `profile_guide`.
+            instrumentation: Where the time spent in the peephole optimizer
+                is recorded as the peephole stage, if anywhere, see the
+                assembler's `instrumentation`.
         """
-        parent = fpath.parent if fpath.is_file() else fpath
         self._label_d: dict[str, int] = {}
         """Used to track unique labels for comparison commands."""
-        self._vm_fname: str
+        self._vm_fname = ""
         """Needed to add VM filename to labels and static variables."""
-        self._function: str
+        self._function = ""
         """Used for label symbols."""
-        self._out = open(f"{parent}/{fpath.stem}.asm", "w")
-        self._bootstrap()
+        self._optimize = optimize
+        self._buffer: list[str] | None = [] if optimize else None
+        """Assembly held for the peephole optimizer."""
+        self._optimized: list[str] = []
+        """Assembly preceding the buffer, already through the peephole
+        optimizer."""
+        self.peephole_removed: Counter[str] = Counter()
+        """Instructions removed by each peephole pattern, once closed."""
+        self._inline = level == "2"
+        self._level = level
+        self._hot_commands = hot_commands
+        self._instrumentation = instrumentation
+        self.rom_size = 0
+        """Number of instructions emitted."""
+        self.estimated_cycles: Counter[str] = Counter()
+        """Instructions executed to run each command passed to `write_commands`
+        once, by kind of command, counting the shared snippets it jumps to and
+        no jumps taken. Peephole optimization is not accounted for."""
+        self._executed = 0
+        """Running count of the instructions executed by the commands written."""
+        self._snippet_cycles: dict[str, int] = {}
+        """Instructions executed by each shared snippet, by label."""
+        self._source_map = source_map
+        self._file_map: tuple[SourceMap, Path] | None = None
+        """Map of the `.asm` file and where `close` writes it, if fpath is
+        given."""
+        if fpath is not None:
+            asm_path = output_path(fpath, ".asm")
+            recorder = SourceMap(asm_path.name) if source_map else None
+            if recorder is not None:
+                self._file_map = recorder, output_path(fpath, MAP_SUFFIX)
+            emitter = AnnotatedEmitter(asm_path, source_map=recorder)
+        self._emitter = ListEmitter() if emitter is None else emitter
+        if bootstrap:
+            self._bootstrap()
+        else:
+            # Only the lengths of the snippets are needed, so their lines are
+            # written into a buffer that is then dropped
+            buffer, self._buffer = self._buffer, []
+            self._write_snippets()
+            self._buffer = buffer
 
     def _bootstrap(self):
         """Write initial assembly."""
         self._function = ""
         self._writelines(["// Bootstrap", "@256", "D=A", "@SP", "M=D"])
         self.write_call("Sys.init", 0)
-        self._write_reusable_comparisons()
-        self._write_reusable_write_call()
-        self._write_reusable_write_return()
+        self._write_snippets()
+
+    def _write_snippets(self):
+        """Write the shared snippets, unless inlining."""
+        if not self._inline:
+            self._write_reusable_comparisons()
+            self._write_reusable_write_call()
+            self._write_reusable_write_return()
 
     def _writelines(self, lines: list[str]):
         """Add newline character to end of each line and write lines to file."""
-        for line in lines:
-            if not line.startswith(
-                (
-                    "// function",
-                    "// Bootstrap",
-                    "// Comparisons",
-                    "// Call reusable snippet",
-                    "// Return reusable snippet",
-                )
-            ):
-                self._out.write("\t" + line + "\n")
-            else:
-                self._out.write(line + "\n")
+        self._executed += _count_instructions(lines)
+        self._emit(lines)
+
+    def _emit(self, lines: list[str]) -> None:
+        """Hold lines in the buffer, if any, or pass them to the emitter."""
+        if self._buffer is not None:
+            self._buffer += lines
+            return
+        self.rom_size += _count_instructions(lines)
+        self._emitter.emit(lines)
+
+    def _write_snippet(self, lines: list[str]) -> None:
+        """Write a shared snippet, whose first label declaration names it.
+
+        Its instructions are recorded as executed by each jump to it rather
+        than by the command being written.
+        """
+        label = next(line for line in lines if line.startswith("("))[1:-1]
+        n_instructions = _count_instructions(lines)
+        self._snippet_cycles[label] = n_instructions
+        self._writelines(lines)
+        self._executed -= n_instructions
 
     def _get_pop_asm(self, segment: str, index, pointer_to_base: None | str):
         """`pop segment index` pops the top stack value and stores it
@@ -93,13 +197,7 @@ class CodeWriter:
                 "A=M",
             ]
         else:
-            lines += [*_POP_TOP_OF_STACK_TO_D]
-            if segment == "temp":
-                lines.append(f"@R{5 + index}")
-            elif segment == "pointer":
-                lines.append("@THIS" if index == 0 else "@THAT")
-            elif segment == "static":
-                lines.append(f"@{self._vm_fname}.{index}")
+            lines += [*_POP_TOP_OF_STACK_TO_D, self._get_register(segment, index)]
 
         # Store the value of register D in selected RAM register
         lines.append("M=D")
@@ -119,14 +217,10 @@ class CodeWriter:
             lines += [f"@{index}", "D=A"]
         else:
             # Select RAM register represented by virtual memory segment entry
-            if segment == "temp":
-                lines.append(f"@R{5 + index}")
-            elif segment == "pointer":
-                lines.append("@THIS" if index == 0 else "@THAT")
-            elif segment == "static":
-                lines.append(f"@{self._vm_fname}.{index}")
-            else:  # Local, argument, this, and that
+            if pointer_to_base:  # Local, argument, this, and that
                 lines += [f"@{pointer_to_base}", "D=M", f"@{index}", "A=D+A"]
+            else:
+                lines.append(self._get_register(segment, index))
             # Set D register to selected RAM register's value
             lines.append("D=M")
 
@@ -134,9 +228,22 @@ class CodeWriter:
         lines += [*_PUSH_D_TO_STACK]
         return lines
 
+    def _get_register(self, segment: str, index: int) -> str:
+        """Return the A-instruction selecting a temp, pointer or static entry."""
+        if segment == "temp":
+            return f"@R{5 + index}"
+        elif segment == "pointer":
+            return "@THIS" if index == 0 else "@THAT"
+        return f"@{self._vm_fname}.{index}"
+
     def _get_return_label_symbol(self):
-        """Return `functionName$ret.i` and update label dictionary with current value of i."""
-        ret_label_prefix = f"{self._function}$ret."
+        """Return `functionName$ret.i` and update label dictionary with current value of i.
+
+        Calls outside any function are numbered per file, as `fileName$ret.i`,
+        so that each file translates the same way on its own. The bootstrap's
+        call, before any file, returns to `$ret.0`.
+        """
+        ret_label_prefix = f"{self._function or self._vm_fname}$ret."
         i = self._label_d.setdefault(ret_label_prefix, 0)
         self._label_d[ret_label_prefix] += 1
         return ret_label_prefix + str(i)
@@ -155,23 +262,36 @@ class CodeWriter:
                 # Save return address
                 "@R14",
                 "M=D",
-                *_POP_TOP_OF_STACK_TO_D,
-                # Calculate and push to stack
-                "A=A-1",
-                "D=M-D",
-                f"M={_VM_TRUE}",
-                f"@{operator}_END",
-                f"D;J{operator}",
-                "@SP",
-                "A=M-1",
-                f"M={_VM_FALSE}",
-                f"({operator}_END)",
+                *self._get_comparison_asm(operator, f"{operator}_END"),
                 # Load return address and jump
                 "@R14",
                 "A=M",
                 "0;JMP",
             ]
-        self._writelines(lines)
+            self._write_snippet(lines)
+            lines = []
+
+    def _get_comparison_asm(self, operator: str, end_label: str) -> list[str]:
+        """Return assembly that replaces the two topmost stack values with the
+        result of comparing them.
+
+        Args:
+            operator: EQ, LT or GT.
+            end_label: Label symbol to declare after the comparison.
+        """
+        return [
+            *_POP_TOP_OF_STACK_TO_D,
+            # Calculate and push to stack
+            "A=A-1",
+            "D=M-D",
+            f"M={_VM_TRUE}",
+            f"@{end_label}",
+            f"D;J{operator}",
+            "@SP",
+            "A=M-1",
+            f"M={_VM_FALSE}",
+            f"({end_label})",
+        ]
 
     def _write_reusable_write_call(self):
         """Write assembly of reusable write call snippet.
@@ -213,13 +333,20 @@ class CodeWriter:
             "A=M",
             "0;JMP",  # Jump to callee
         ]
-        self._writelines(lines)
+        self._write_snippet(lines)
 
     def _write_reusable_write_return(self):
         """Write assembly of reusable write return snippet."""
         lines = [
             "// Return reusable snippet",
             "(START_RETURN)",
+            *self._get_return_asm(),
+        ]
+        self._write_snippet(lines)
+
+    def _get_return_asm(self) -> list[str]:
+        """Return assembly that returns from the current function."""
+        return [
             "@LCL",
             "D=M",
             "@R13",
@@ -253,7 +380,6 @@ class CodeWriter:
             "A=M",  # Select return address
             "0;JMP",  # Jump to the return address
         ]
-        self._writelines(lines)
 
     def _write_comparison_command(self, command: str):
         """Write assembly code to effect comparison commands.
@@ -263,11 +389,17 @@ class CodeWriter:
         The same symbol is used as a variable to set the A register to the
         return address, which is then stored in the D register. Control
         then jumps to the reusable comparison assembly.
+
+        When inlining, the comparison is written in place instead.
         """
         operator = command.upper()
         num = self._label_d.setdefault(operator, 0)
         self._label_d[operator] += 1
-        return_address_symbol = f"RET_ADDRESS_{operator}{num}"
+        if self._inline:
+            end_label = f"{self._vm_fname}.{operator}_END{num}"
+            return self._get_comparison_asm(operator, end_label)
+        self._executed += self._snippet_cycles[f"{operator}_START"]
+        return_address_symbol = f"{self._vm_fname}.RET_ADDRESS_{operator}{num}"
         return [
             f"@{return_address_symbol}",
             "D=A",
@@ -277,12 +409,125 @@ class CodeWriter:
         ]
 
     def close(self) -> None:
-        """Close the output file."""
-        self._out.close()
+        """Emit the assembly held for the peephole optimizer and close the
+        emitter."""
+        if self._optimize:
+            self._flush_optimized()
+            lines, self._optimized, self._buffer = self._optimized, [], None
+            self._emit(lines)
+        self._emitter.close()
+        if self._file_map is not None:
+            self._file_map[0].write(self._file_map[1])
+
+    def _flush_optimized(self) -> None:
+        """Run the buffer through the peephole optimizer into `_optimized`."""
+        if self._instrumentation is None:
+            lines, removed = peephole.optimize(self._buffer)
+        else:
+            with self._instrumentation.stage("peephole"):
+                lines, removed = peephole.optimize(self._buffer)
+        self._optimized += lines
+        self.peephole_removed += removed
+        self._buffer = []
 
     def set_file_name(self, fname: str) -> None:
-        """Inform that the translation of a new VM file has started."""
+        """Inform that the translation of a new VM file has started.
+
+        Comparison return addresses are numbered per file, so each file
+        translates the same way on its own. Its commands are outside any
+        function until its first `function` command.
+        """
         self._vm_fname = fname
+        self._function = ""
+        for operator in ("EQ", "LT", "GT"):
+            self._label_d.pop(operator, None)
+
+    def take_lines(self) -> list[str]:
+        """Return and forget the assembly emitted into memory so far, see
+        `ListEmitter`.
+
+        Once closed, this is the whole program, after peephole optimization
+        if enabled.
+        """
+        return self._emitter.take_lines()
+
+    def write_fragment(
+        self,
+        lines: list[str],
+        estimated_cycles: Counter[str],
+        peephole_removed: Counter[str] | None = None,
+    ):
+        """Write assembly translated by another writer, see `take_lines`.
+
+        Args:
+            lines: The assembly.
+            estimated_cycles: The `estimated_cycles` of the other writer.
+            peephole_removed: What the peephole optimizer removed from lines,
+                if they went through it on their own. The optimizer does not
+                look past labels, so this gives the same result as optimizing
+                the whole program only if lines, and the lines written after
+                them, start with a label, see `starts_with_label`.
+        """
+        self.estimated_cycles += estimated_cycles
+        if peephole_removed is None or not self._optimize:
+            self._emit(lines)
+            return
+        self._flush_optimized()
+        self._optimized += lines
+        self.peephole_removed += peephole_removed
+
+    def write_commands(self, commands: Iterable[Command]) -> None:
+        """Write the assembly code that implements each parsed command."""
+        for command in commands:
+            executed = self._executed
+            if self._source_map:
+                if command.command_type is CommandType.C_FUNCTION:
+                    function = command.arg_1
+                else:
+                    function = self._function
+                self._emit([origin_marker(self._vm_fname, command.line_no, function)])
+            if self._hot_commands is not None:
+                self._inline = (self._vm_fname, command.line_no) in self._hot_commands
+            match command.command_type:
+                case CommandType.C_ARITHMETIC:
+                    self.write_arithmetic(command.arg_1)
+                case CommandType.C_CALL:
+                    self.write_call(command.arg_1, command.arg_2)
+                case CommandType.C_FUNCTION:
+                    self.write_function(command.arg_1, command.arg_2)
+                case CommandType.C_GOTO:
+                    self.write_goto(command.arg_1)
+                case CommandType.C_IF:
+                    self.write_if(command.arg_1)
+                case CommandType.C_LABEL:
+                    self.write_label(command.arg_1)
+                case CommandType.C_PUSH | CommandType.C_POP:
+                    self.write_push_pop(
+                        command.command_type, command.arg_1, command.arg_2
+                    )
+                case CommandType.C_RETURN:
+                    self.write_return()
+            if command.arg_1 in ("eq", "gt", "lt"):
+                kind = "comparison"
+            else:
+                kind = command.command_type.name[2:].lower()
+            self.estimated_cycles[kind] += self._executed - executed
+
+    def count_instructions(self, commands: Iterable[Command]) -> int:
+        """Return the number of instructions commands translate to, without
+        writing them, after peephole optimization if enabled.
+
+        Translating consumes unique label symbols, so this should be called
+        after the commands of the program have been written.
+        """
+        buffer, self._buffer = self._buffer, []
+        executed, estimated_cycles = self._executed, self.estimated_cycles.copy()
+        self.write_commands(commands)
+        lines, self._buffer = self._buffer, buffer
+        self._executed, self.estimated_cycles = executed, estimated_cycles
+        if self._optimize:
+            lines, _ = peephole.optimize(lines)
+        return _count_instructions(lines)
 
     def write_arithmetic(self, command: str) -> None:
         """Write to the output file the assembly code that implements
@@ -318,6 +563,34 @@ class CodeWriter:
             n_args: The number of arguments pushed onto the stack.
         """
         return_label_symbol = self._get_return_label_symbol()
+        if self._inline:
+            lines = [
+                f"// call {fn_name} {n_args}",
+                f"@{return_label_symbol}",
+                "D=A",
+                *_PUSH_D_TO_STACK,  # Push return address
+            ]
+            for pointer in ("LCL", "ARG", "THIS", "THAT"):
+                lines += [f"@{pointer}", "D=M", *_PUSH_D_TO_STACK]
+            lines += [
+                "@SP",
+                "D=M",
+                f"@{5 + n_args}",
+                "D=D-A",
+                "@ARG",
+                "M=D",  # Update ARG for callee function
+                "@SP",
+                "D=M",
+                "@LCL",
+                "M=D",  # Update LCL for callee function
+                f"@{fn_name}",
+                "0;JMP",  # Jump to callee
+                f"({return_label_symbol})",
+            ]
+            self._writelines(lines)
+            return
+        # The bootstrap calls Sys.init before the snippet is written
+        self._executed += self._snippet_cycles.get("CALL_START", 0)
         lines = [
             f"// call {fn_name} {n_args}",
             f"@{n_args}",
@@ -349,10 +622,41 @@ class CodeWriter:
         lines = [f"// function {fn_name} {n_vars}", f"({fn_name})"]
         # Push 0 to stack for each local variable
         if n_vars:
-            lines += ["@SP", "A=M", "M=0"]
+            unrolled = ["@SP", "A=M", "M=0"]
             for _ in range(n_vars - 1):
-                lines += ["@SP", "AM=M+1", "M=0"]
-            lines += ["@SP", "M=M+1"]
+                unrolled += ["@SP", "AM=M+1", "M=0"]
+            unrolled += ["@SP", "M=M+1"]
+            if self._level == "0":
+                lines += unrolled
+            else:
+                # Zero the locals by walking A over them, or in a loop
+                walk = ["@SP", "A=M", "M=0", *["A=A+1", "M=0"] * (n_vars - 1)]
+                walk += ["D=A+1", "@SP", "M=D"]
+                loop_label = f"{fn_name}$$zero_locals"
+                loop = [
+                    f"@{n_vars}",
+                    "D=A",
+                    f"({loop_label})",
+                    "@SP",
+                    "AM=M+1",
+                    "A=A-1",
+                    "M=0",
+                    "D=D-1",
+                    f"@{loop_label}",
+                    "D;JGT",
+                ]
+                prologues = [  # Lines and instructions executed
+                    (unrolled, len(unrolled)),
+                    (walk, len(walk)),
+                    (loop, 2 + 7 * n_vars),
+                ]
+                if self._level == "s":
+                    key = lambda p: (_count_instructions(p[0]), p[1])
+                else:
+                    key = lambda p: (p[1], _count_instructions(p[0]))
+                prologue, cycles = min(prologues, key=key)
+                lines += prologue
+                self._executed += cycles - _count_instructions(prologue)
 
         self._writelines(lines)
 
@@ -406,5 +710,212 @@ class CodeWriter:
         the call command in the code of the function that called the
         current function.
         """
+        if self._inline:
+            self._writelines(["// return", *self._get_return_asm()])
+            return
+        self._executed += self._snippet_cycles["START_RETURN"]
         lines = [f"// return", "@START_RETURN", "0;JMP"]
         self._writelines(lines)
+
+
+class CachingCodeWriter(CodeWriter):
+    """Maps VM commands to Hack machine language, keeping the top of the
+    stack in registers.
+
+    Within a sequence of push, pop and arithmetic commands, the topmost
+    stack value is held in D instead of RAM, and SP does not count it. A
+    constant, temp, pointer or static value pushed on top of it is not
+    loaded until needed, so that a binary command can take it straight from
+    A or M. The values are spilled, i.e. pushed to RAM, before labels,
+    functions, gotos, calls, returns and comparisons, so that control always
+    enters and leaves a sequence with the whole stack in RAM. `if-goto`
+    takes its condition from D.
+    """
+
+    _MAX_INCREMENTS = 7
+    """Largest index popped to by incrementing the segment base address."""
+
+    def __init__(
+        self,
+        fpath: Path | None,
+        optimize: bool = False,
+        level: str = "0",
+        bootstrap: bool = True,
+        emitter: Emitter | None = None,
+        source_map: bool = False,
+        hot_commands: Collection[tuple[str, int]] | None = None,
+        instrumentation=None,
+    ) -> None:
+        self._cached = False
+        """Whether D holds the top of stack."""
+        self._pending: tuple[str, str] | None = None
+        """Value pushed above D, as the A-instruction selecting it and the
+        register, A or M, holding it once selected."""
+        super().__init__(
+            fpath,
+            optimize,
+            level,
+            bootstrap,
+            emitter,
+            source_map,
+            hot_commands,
+            instrumentation,
+        )
+
+    def _load_pending(self) -> list[str]:
+        """Return assembly that moves the pending value to the top of stack in D."""
+        if self._pending is None:
+            return []
+        select, register = self._pending
+        self._pending = None
+        return [*_PUSH_D_TO_STACK, select, f"D={register}"]
+
+    def _spill(self) -> list[str]:
+        """Return assembly that pushes the cached values to RAM."""
+        lines = self._load_pending()
+        if self._cached:
+            self._cached = False
+            lines += _PUSH_D_TO_STACK
+        return lines
+
+    def _fill(self) -> list[str]:
+        """Return assembly that gets the top of stack in D, popping it if needed."""
+        lines = self._load_pending()
+        if not self._cached:
+            self._cached = True
+            lines += _POP_TOP_OF_STACK_TO_D
+        return lines
+
+    def write_arithmetic(self, command: str) -> None:
+        """Write assembly code that implements the arithmetic-logical command,
+        leaving the result in D.
+
+        Comparisons use the reusable snippets, which expect their operands
+        in RAM.
+        """
+        if command in ("gt", "lt", "eq"):
+            self._writelines(self._spill())
+            super().write_arithmetic(command)
+            return
+        lines = [f"// {command}"]
+        if self._pending is not None and command in _ARITHMETIC_ASM_MAP:
+            select, register = self._pending
+            self._pending = None
+            lines += [select, f"D=D{_OPERATORS[command]}{register}"]
+        else:
+            lines += self._fill()
+            if command in _ARITHMETIC_ASM_MAP:
+                lines += ["@SP", "AM=M-1"]  # Select second operand and pop it
+            lines.append(_CACHED_ARITHMETIC_ASM_MAP[command])
+        self._writelines(lines)
+
+    def write_commands(self, commands: Iterable[Command]) -> None:
+        """Write the commands, leaving nothing cached at the end."""
+        super().write_commands(commands)
+        self._writelines(self._spill())
+
+    def write_call(self, fn_name: str, n_args: int) -> None:
+        self._writelines(self._spill())
+        super().write_call(fn_name, n_args)
+
+    def write_function(self, fn_name: str, n_vars: int) -> None:
+        self._writelines(self._spill())
+        super().write_function(fn_name, n_vars)
+
+    def write_goto(self, label: str) -> None:
+        self._writelines(self._spill())
+        super().write_goto(label)
+
+    def write_if(self, label: str) -> None:
+        lines = [
+            f"// if-goto {label}",
+            *self._fill(),
+            f"@{self._function}${label}",
+            "D;JNE",  # Jump if D is true
+        ]
+        self._cached = False
+        self._writelines(lines)
+
+    def write_label(self, label: str) -> None:
+        self._writelines(self._spill())
+        super().write_label(label)
+
+    def write_push_pop(
+        self,
+        command: Literal[CommandType.C_POP, CommandType.C_PUSH],
+        segment: str,
+        index: int,
+    ) -> None:
+        """Write assembly code that implements the push/pop command.
+
+        A push loads the value into D, or leaves it pending if D is in use.
+        A pop stores D, popping it first if it is not cached.
+        """
+        pointer = _VIRTUAL_SEGMENT_POINTER.get(segment)
+        if command == CommandType.C_PUSH:
+            lines = [f"// Push {segment} {index}"]
+            if self._cached and self._pending is None and pointer is None:
+                if segment == "constant":
+                    self._pending = f"@{index}", "A"
+                else:
+                    self._pending = self._get_register(segment, index), "M"
+                self._writelines(lines)
+                return
+            lines = self._spill() + lines
+            if segment == "constant":
+                lines += [f"@{index}", "D=A"]
+            elif pointer is None:
+                lines += [self._get_register(segment, index), "D=M"]
+            elif index < 2:
+                lines += [f"@{pointer}", "A=M", *["A=A+1"] * index, "D=M"]
+            else:
+                lines += [f"@{pointer}", "D=M", f"@{index}", "A=D+A", "D=M"]
+            self._cached = True
+        else:
+            lines = [f"// Pop {segment} {index}", *self._fill()]
+            if pointer is None:
+                lines += [self._get_register(segment, index), "M=D"]
+            elif index <= self._MAX_INCREMENTS:
+                lines += [f"@{pointer}", "A=M", *["A=A+1"] * index, "M=D"]
+            else:
+                lines += [
+                    "@R13",
+                    "M=D",  # Save value since D register needed for address
+                    f"@{pointer}",
+                    "D=M",
+                    f"@{index}",
+                    "D=D+A",
+                    "@R14",
+                    "M=D",
+                    "@R13",
+                    "D=M",
+                    "@R14",
+                    "A=M",
+                    "M=D",
+                ]
+            self._cached = False
+        self._writelines(lines)
+
+    def write_return(self) -> None:
+        self._writelines(self._spill())
+        super().write_return()
+
+
+def output_path(fpath: Path, suffix: str) -> Path:
+    """Return the path of the file a `.vm` file or a directory translates to."""
+    parent = fpath.parent if fpath.is_file() else fpath
+    return parent / (fpath.stem + suffix)
+
+
+def starts_with_label(lines: Iterable[str]) -> bool:
+    """Return whether the first line of assembly that is not a comment
+    declares a label."""
+    for line in lines:
+        if not line.startswith("//"):
+            return line.startswith("(")
+    return False
+
+
+def _count_instructions(lines: list[str]) -> int:
+    """Return the number of lines that are neither comments nor labels."""
+    return sum(not line.startswith(("//", "(")) for line in lines)
@@ -0,0 +1,138 @@
+"""Output backends of `CodeWriter`.
+
+`CodeWriter` hands its assembly to an emitter in batches of lines, without
+indentation or line ends. Text emitters hold the lines until enough are
+pending, then format them all at once and write them with a single call,
+so that large programs are written with few calls. Given a `SourceMap`,
+they also leave out origin markers and record the origin of each line.
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TextIO
+from source_map import SourceMap
+
+_SECTION_COMMENTS = (
+    "// function",
+    "// Bootstrap",
+    "// Comparisons",
+    "// Call reusable snippet",
+    "// Return reusable snippet",
+)
+"""Comments written without indentation by `AnnotatedEmitter`."""
+
+
+class Emitter(ABC):
+    """Where `CodeWriter` writes assembly."""
+
+    @abstractmethod
+    def emit(self, lines: list[str]) -> None:
+        """Write lines of assembly."""
+
+    def close(self) -> None:
+        """Write anything held back, and close what the emitter opened."""
+
+
+class ListEmitter(Emitter):
+    """Keeps the lines in memory, as they are."""
+
+    def __init__(self) -> None:
+        self.lines: list[str] = []
+        """The lines emitted and not yet taken."""
+
+    def emit(self, lines: list[str]) -> None:
+        self.lines += lines
+
+    def take_lines(self) -> list[str]:
+        """Return and forget the lines emitted so far."""
+        lines, self.lines = self.lines, []
+        return lines
+
+
+class TextEmitter(Emitter):
+    """Writes the lines to a text stream, one per line."""
+
+    _keeps_comments = True
+    """Whether comments are written."""
+
+    def __init__(
+        self,
+        out: TextIO | Path | str,
+        bulk_lines: int = 2**16,
+        source_map: SourceMap | None = None,
+        instrumentation=None,
+    ) -> None:
+        """Create an emitter.
+
+        Args:
+            out: A stream, such as an `io.StringIO`, which is left open, or
+                the path of a file to create, which is closed with the
+                emitter.
+            bulk_lines: Number of lines held before they are written to out
+                with a single call.
+            source_map: Where the origin of each line written is recorded.
+            instrumentation: Where the time spent writing is recorded as the
+                write stage, if anywhere, see the assembler's
+                `instrumentation`.
+        """
+        self._owned = not hasattr(out, "write")
+        self._out: TextIO = open(out, "w") if self._owned else out
+        self._bulk_lines = bulk_lines
+        self._source_map = source_map
+        self._pending: list[str] = []
+        """Lines not yet written."""
+        self._instrumentation = instrumentation
+
+    def _format(self, lines: list[str]) -> str:
+        """Return lines as text, each ending with a newline."""
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def emit(self, lines: list[str]) -> None:
+        self._pending += lines
+        if len(self._pending) >= self._bulk_lines:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the pending lines to the stream."""
+        if self._instrumentation is None:
+            self._write_pending()
+        else:
+            with self._instrumentation.stage("write"):
+                self._write_pending()
+
+    def _write_pending(self) -> None:
+        lines = self._pending
+        if self._source_map is not None:
+            lines = self._source_map.record(lines, self._keeps_comments)
+        self._out.write(self._format(lines))
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if self._owned:
+            self._out.close()
+
+
+class AnnotatedEmitter(TextEmitter):
+    """Writes the lines indented, except for the comments that start a
+    section such as a function, which are written flush left."""
+
+    def _format(self, lines: list[str]) -> str:
+        if not lines:
+            return ""
+        # Indent every line, then take the few section comments back out
+        text = "\n\t" + "\n\t".join(lines)
+        for comment in _SECTION_COMMENTS:
+            text = text.replace("\n\t" + comment, "\n" + comment)
+        return text[1:] + "\n"
+
+
+class MinifiedEmitter(TextEmitter):
+    """Writes the lines without comments or indentation."""
+
+    _keeps_comments = False
+
+    def _format(self, lines: list[str]) -> str:
+        # Lines are never empty, and only comments start with a slash
+        kept = [line for line in lines if line[0] != "/"]
+        return "\n".join(kept) + "\n" if kept else ""
@@ -0,0 +1,134 @@
+"""Cache of the assembly each VM file translates to.
+
+Each file translates the same way on its own, see `CodeWriter.set_file_name`,
+so its assembly fragment can be reused for as long as the commands it
+translates and the translation options are unchanged. Fragments are keyed
+by a hash of both, and kept in memory and optionally on disk, where each
+file has a single entry that is replaced when the file changes.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from parser import Command
+
+TRANSLATOR_VERSION = "2"
+"""Changes whenever `CodeWriter` could produce different output."""
+
+_ENTRY_SUFFIX = ".fragment"
+
+
+class Fragment:
+    """The assembly of a VM file translated on its own."""
+
+    __slots__ = ("lines", "estimated_cycles", "optimized", "peephole_removed")
+
+    def __init__(
+        self,
+        lines: list[str],
+        estimated_cycles: Counter[str],
+        optimized: list[str] | None = None,
+        peephole_removed: Counter[str] | None = None,
+    ) -> None:
+        self.lines = lines
+        """The assembly, see `CodeWriter.take_lines`."""
+        self.estimated_cycles = estimated_cycles
+        """See `CodeWriter.estimated_cycles`."""
+        self.optimized = optimized
+        """The assembly through the peephole optimizer, if it was run on its
+        own, see `CodeWriter.write_fragment`."""
+        self.peephole_removed = peephole_removed
+        """Instructions removed from optimized by each peephole pattern."""
+
+
+class FragmentCache:
+    """Assembly fragments of VM files, by file name.
+
+    An entry file holds the key and the fragment as JSON.
+    """
+
+    def __init__(self, directory: Path | None = None) -> None:
+        """Open or create the cache.
+
+        Args:
+            directory: Where entries are stored, or None to keep them in
+                memory only.
+        """
+        self._directory = directory
+        self._fragments: dict[str, tuple[str, Fragment]] = {}
+        """Key and fragment of each file looked up or stored."""
+        self._keys: dict[str, tuple[str, list[Command], str]] = {}
+        """Options, commands and key of each file whose key was computed."""
+        self.hits = 0
+        """Lookups that found a fragment since the cache was opened."""
+        self.misses = 0
+        """Lookups that found no fragment since the cache was opened."""
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, options: str, fname: str, commands: list[Command]) -> str:
+        """Return the key of the commands of a file translated with options.
+
+        The key is remembered until other commands are passed for the file,
+        so the commands must not be modified in between.
+        """
+        known = self._keys.get(fname)
+        if known is not None and known[0] == options and known[1] is commands:
+            return known[2]
+        digest = hashlib.sha256(f"{TRANSLATOR_VERSION}\0{options}\0{fname}\0".encode())
+        digest.update(
+            "\n".join(f"{command.line_no} {command}" for command in commands).encode()
+        )
+        key = digest.hexdigest()
+        self._keys[fname] = options, commands, key
+        return key
+
+    def get(self, fname: str, key: str) -> Fragment | None:
+        """Return the fragment of fname stored under key, if any."""
+        entry = self._fragments.get(fname)
+        if entry is None and self._directory is not None:
+            try:
+                with open(self._entry_path(fname), "rt", encoding="utf-8") as f:
+                    stored = json.load(f)
+            except FileNotFoundError:
+                pass
+            else:
+                removed = stored["removed"]
+                fragment = Fragment(
+                    stored["lines"],
+                    Counter(stored["cycles"]),
+                    stored["optimized"],
+                    None if removed is None else Counter(removed),
+                )
+                entry = self._fragments[fname] = stored["key"], fragment
+        if entry is None or entry[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, fname: str, key: str, fragment: Fragment) -> None:
+        """Store the fragment of fname under key, replacing its previous one."""
+        self._fragments[fname] = key, fragment
+        if self._directory is None:
+            return
+        # Write to a temporary file first so readers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=self._directory)
+        with os.fdopen(fd, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "key": key,
+                    "lines": fragment.lines,
+                    "cycles": fragment.estimated_cycles,
+                    "optimized": fragment.optimized,
+                    "removed": fragment.peephole_removed,
+                },
+                f,
+            )
+        os.replace(temp_path, self._entry_path(fname))
+
+    def _entry_path(self, fname: str) -> Path:
+        return self._directory / (fname + _ENTRY_SUFFIX)
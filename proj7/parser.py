@@ -1,5 +1,100 @@
 from command_type import CommandType
 
+_COMMAND_TYPES = {
+    **dict.fromkeys(
+        ("add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"),
+        CommandType.C_ARITHMETIC,
+    ),
+    "push": CommandType.C_PUSH,
+    "pop": CommandType.C_POP,
+    "call": CommandType.C_CALL,
+    "goto": CommandType.C_GOTO,
+    "if-goto": CommandType.C_IF,
+    "function": CommandType.C_FUNCTION,
+    "label": CommandType.C_LABEL,
+    "return": CommandType.C_RETURN,
+}
+_KEYWORDS = {
+    command_type: keyword
+    for keyword, command_type in _COMMAND_TYPES.items()
+    if command_type is not CommandType.C_ARITHMETIC
+}
+_COMMANDS_WITH_ARG_2 = {
+    CommandType.C_PUSH,
+    CommandType.C_POP,
+    CommandType.C_FUNCTION,
+    CommandType.C_CALL,
+}
+
+
+class Command:
+    """A VM command parsed into its type and arguments."""
+
+    __slots__ = ("command_type", "arg_1", "arg_2", "line_no")
+
+    def __init__(
+        self,
+        command_type: CommandType,
+        arg_1: str | None = None,
+        arg_2: int | None = None,
+        line_no: int = 0,
+    ) -> None:
+        """
+        Args:
+            command_type: The type of the command.
+            arg_1: The first argument, or the command itself for C_ARITHMETIC.
+                None for C_RETURN.
+            arg_2: The second argument of C_PUSH, C_POP, C_FUNCTION and
+                C_CALL commands, else None.
+            line_no: The line of the VM file the command is on, counting from 1.
+        """
+        self.command_type = command_type
+        self.arg_1 = arg_1
+        self.arg_2 = arg_2
+        self.line_no = line_no
+
+    def __repr__(self) -> str:
+        return (
+            f"Command({self.command_type}, {self.arg_1!r}, {self.arg_2!r}, "
+            f"{self.line_no})"
+        )
+
+    def __str__(self) -> str:
+        """Return the command as a line of VM code, e.g. `push local 2`."""
+        if self.command_type is CommandType.C_ARITHMETIC:
+            return self.arg_1
+        items = [_KEYWORDS[self.command_type], self.arg_1, self.arg_2]
+        return " ".join(str(item) for item in items if item is not None)
+
+
+def parse_file(fpath) -> list[Command]:
+    """Parse every command of a VM file in a single pass.
+
+    Each line is split once, unlike with `Parser`, whose accessors split
+    the current line again on every call.
+
+    Args:
+        fpath: path to VM file
+    """
+    commands = []
+    with open(fpath, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            items = line.split()
+            if not items or items[0].startswith("//"):
+                continue
+            command_type = _COMMAND_TYPES.get(items[0])
+            if command_type is None:
+                raise ValueError("Unknown command type")
+            if command_type is CommandType.C_ARITHMETIC:
+                arg_1 = items[0]
+            elif command_type is CommandType.C_RETURN:
+                arg_1 = None
+            else:
+                arg_1 = items[1]
+            arg_2 = int(items[2]) if command_type in _COMMANDS_WITH_ARG_2 else None
+            commands.append(Command(command_type, arg_1, arg_2, line_no))
+    return commands
+
 
 class Parser:
     """Parses Hack VM commands from a single VM file."""
@@ -0,0 +1,96 @@
+"""Peephole optimizer for the assembly written by `CodeWriter`.
+
+`CodeWriter` translates each VM command through a fixed template, so the
+boundary between two commands often moves a value through the stack and
+straight back, or loads A only to load it again. The optimizer slides over
+the instructions and rewrites the last few of them whenever they match one
+of the patterns below, until none matches.
+
+Label declarations end the window, since control can reach them by a jump.
+Comments are kept and do not end the window.
+"""
+
+from collections import Counter
+from collections.abc import Iterable
+
+_PUSH_D = ("@SP", "AM=M+1", "A=A-1", "M=D")
+"""How `CodeWriter` pushes D, the tail of every push."""
+_POP_D = ("@SP", "AM=M-1", "D=M")
+"""How `CodeWriter` pops into D, the head of most pops and operators."""
+_PUSH_POP_D = [*_PUSH_D, *_POP_D]
+
+PATTERNS = ("push-pop", "dead-a", "a-offset")
+"""Names of the rewrites, in the order they are tried.
+
+- push-pop: D pushed and popped straight back. Only SP needs to be selected
+  afterwards, as the following instruction may address the top of stack.
+- dead-a: an instruction whose only effect is setting A, followed by an
+  A-instruction.
+- a-offset: `A=M` followed by `A=A-1` or `A=A+1`.
+"""
+
+
+def optimize(lines: Iterable[str]) -> tuple[list[str], Counter[str]]:
+    """Remove redundant instructions from lines of assembly.
+
+    Args:
+        lines: Instructions, label declarations and `//` comments, without
+            indentation.
+
+    Returns:
+        tuple: The optimized lines, and the number of instructions removed
+            by each pattern.
+    """
+    out: list[str | None] = []
+    window: list[int] = []  # Indices in out of the instructions since the last label
+    removed: Counter[str] = Counter()
+    for line in lines:
+        if line.startswith("//"):
+            out.append(line)
+            continue
+        if line.startswith("("):
+            window.clear()
+        else:
+            window.append(len(out))
+        out.append(line)
+        while pattern := _rewrite(out, window):
+            removed[pattern[0]] += pattern[1]
+    return [line for line in out if line is not None], removed
+
+
+def _rewrite(out: list[str | None], window: list[int]) -> tuple[str, int] | None:
+    """Rewrite the end of the window if it matches a pattern.
+
+    Removed instructions are replaced by None in out and dropped from the
+    window.
+
+    Returns:
+        tuple: The name of the pattern and the number of instructions it
+            removed, or None if no pattern matched.
+    """
+    if len(window) < 2:
+        return None
+    last = out[window[-1]]
+    previous = out[window[-2]]
+    if last == "D=M" and [out[i] for i in window[-7:]] == _PUSH_POP_D:
+        # Leaves A and SP as the pop did, the copy above the stack is not needed
+        out[window[-7]], out[window[-6]] = "@SP", "A=M"
+        _remove(out, window, 5)
+        return "push-pop", 5
+    if last.startswith("@") and (
+        previous.startswith("@") or previous.startswith("A=") and ";" not in previous
+    ):
+        out[window.pop(-2)] = None
+        return "dead-a", 1
+    if previous == "A=M" and last in ("A=A-1", "A=A+1"):
+        out[window[-2]] = "A=M" + last[-2:]
+        _remove(out, window, 1)
+        return "a-offset", 1
+    return None
+
+
+def _remove(out: list[str | None], window: list[int], count: int) -> None:
+    """Remove the last count instructions of the window from out."""
+    for i in window[-count:]:
+        out[i] = None
+    del window[-count:]
@@ -0,0 +1,135 @@
+"""Picks the commands to write inline from a recorded execution profile.
+
+At levels 0 and s, every call, return and comparison jumps to a shared
+snippet, which keeps the program small but costs a few cycles on each
+execution. Given how many times each command ran, the hot ones can be
+written inline instead, as at level 2, while the cold ones keep jumping to
+the snippets.
+
+The counts come from a profile written by the CPU emulator, see the
+assembler's `profiler`, of a build translated with a source map: each
+ROM address is traced to its `.asm` line and from there to its VM command.
+Commands are identified by file and line, so the profile can come from a
+build with other options, as long as the VM files did not change.
+"""
+
+import json
+from collections import Counter
+from command_type import CommandType
+from parser import Command
+from source_map import SourceMap
+
+ROM_WORDS = 32768
+"""Number of words of the Hack ROM, the default budget."""
+HOT_FRACTION = 0.01
+"""Fraction of the count of the hottest command that a command must reach
+to be written inline."""
+
+
+def is_inlinable(command: Command) -> bool:
+    """Can command be written inline instead of jumping to a snippet?"""
+    if command.command_type is CommandType.C_ARITHMETIC:
+        return command.arg_1 in ("eq", "gt", "lt")
+    return command.command_type in (CommandType.C_CALL, CommandType.C_RETURN)
+
+
+class ProfileGuide:
+    """Execution counts of the VM commands of a program."""
+
+    def __init__(
+        self, counts: Counter[tuple[str, int]], calls: dict[str, int] | None = None
+    ) -> None:
+        self.counts = counts
+        """Number of times each command ran, by file name and line."""
+        self.calls = calls or {}
+        """Number of times each function was called, by name."""
+
+    @classmethod
+    def from_profile(cls, profile: dict, source_map: SourceMap) -> "ProfileGuide":
+        """Count the commands of a profiled program.
+
+        A command ran as many times as the most executed of its instructions,
+        since its assembly is only ever entered at its first instruction.
+
+        Args:
+            profile: A profile, see `profiler.ProfilingHackComputer.profile`,
+                with the `.asm` line of each address.
+            source_map: The source map of the `.asm` file that was profiled.
+
+        Raises:
+            ValueError: The profile has no `.asm` lines.
+        """
+        counts: Counter[tuple[str, int]] = Counter()
+        for entry in profile["addresses"]:
+            if "asm_line" not in entry:
+                raise ValueError("Profile has no .asm lines, assemble with --map")
+            origin = source_map.lines[entry["asm_line"] - 1]
+            if origin < 0:
+                continue
+            file, _, line_no = source_map.origins[origin]
+            command = source_map.files[file], line_no
+            counts[command] = max(counts[command], entry["cycles"])
+        return cls(counts, profile.get("calls"))
+
+    @classmethod
+    def read(cls, profile_path, map_path) -> "ProfileGuide":
+        """Read a profile written by the CPU emulator and the source map of
+        the `.asm` file it ran, see `from_profile`."""
+        with open(profile_path, "rt", encoding="utf-8") as f:
+            profile = json.load(f)
+        return cls.from_profile(profile, SourceMap.read(map_path))
+
+    def hot_commands(
+        self,
+        programs: dict[str, list[Command]],
+        writer_class,
+        level: str = "0",
+        optimize: bool = False,
+        rom_budget: int = ROM_WORDS,
+        hot_fraction: float = HOT_FRACTION,
+    ) -> set[tuple[str, int]]:
+        """Return the commands of programs to write inline.
+
+        Commands are taken from the most executed down, for as long as they
+        ran at least hot_fraction times as often as the most executed one
+        and the program, with each command taken written inline, fits in
+        rom_budget words.
+
+        Args:
+            programs: The commands to translate, by file name.
+            writer_class: `CodeWriter` or a subclass, as for the translation.
+            level: Optimization level of the translation, 0 or s.
+            optimize: Whether the assembly goes through the peephole
+                optimizer.
+            rom_budget: Number of words the program must fit in.
+            hot_fraction: See `HOT_FRACTION`.
+        """
+        writer = writer_class(None, optimize, level)
+        inline_writer = writer_class(None, optimize, "2", bootstrap=False)
+        candidates = []
+        for fname, commands in programs.items():
+            writer.set_file_name(fname)
+            writer.write_commands(commands)
+            for command in commands:
+                count = self.counts.get((fname, command.line_no), 0)
+                if count and is_inlinable(command):
+                    candidates.append((count, fname, command))
+        writer.close()
+        size = writer.rom_size
+        hot: set[tuple[str, int]] = set()
+        if not candidates:
+            return hot
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        threshold = candidates[0][0] * hot_fraction
+        for count, fname, command in candidates:
+            if count < threshold:
+                break
+            # The numbered labels do not change the number of instructions
+            writer.set_file_name(fname)
+            inline_writer.set_file_name(fname)
+            inline = inline_writer.count_instructions([command])
+            growth = inline - writer.count_instructions([command])
+            if size + growth <= rom_budget:
+                size += growth
+                hot.add((fname, command.line_no))
+        return hot
@@ -0,0 +1,110 @@
+"""Debug information mapping the lines of a `.asm` file to VM commands.
+
+With a source map, `CodeWriter` writes an origin marker, a comment starting
+with `ORIGIN_MARKER`, before the assembly of each VM command. Markers are
+comments, so they go through the peephole optimizer, fragments and caches
+like the rest of the assembly. The text emitters leave them out of the
+output and record the command that each line they write comes from.
+
+A map file is JSON holding the `.asm` file, the VM files, the functions,
+the origins as `[file, function, VM line]` indices, and the origin of each
+line of the `.asm` file, or -1 for the bootstrap code and shared snippets.
+It is written next to the `.asm` file with the suffix `MAP_SUFFIX`.
+Together with the ROM map of the assembler, it takes a PC to its VM line
+with list lookups.
+"""
+
+import json
+
+ORIGIN_MARKER = "//@"
+MAP_SUFFIX = ".asm.map"
+
+
+def origin_marker(fname: str, line_no: int, function: str) -> str:
+    """Return the marker of the command at line_no of VM file fname."""
+    return f"{ORIGIN_MARKER} {fname} {line_no} {function}"
+
+
+class SourceMap:
+    """Where each line of a `.asm` file comes from."""
+
+    def __init__(self, asm_path: str = "") -> None:
+        self.asm_path = asm_path
+        """The assembly file."""
+        self.files: list[str] = []
+        """Names of the VM files, without extension."""
+        self.functions: list[str] = []
+        """Names of the functions, or "" for commands outside of functions."""
+        self.origins: list[tuple[int, int, int]] = []
+        """Index in `files`, index in `functions` and line of each command."""
+        self.lines: list[int] = []
+        """Index in `origins` of each line of the assembly file, or -1."""
+        self._origin = -1
+        self._file_indices: dict[str, int] = {}
+        self._function_indices: dict[str, int] = {}
+
+    def record(self, lines: list[str], keep_comments: bool = True) -> list[str]:
+        """Record the origin of each of lines written to the assembly file.
+
+        Args:
+            lines: The lines, including markers.
+            keep_comments: Whether comments are written.
+
+        Returns:
+            list: The lines written, without markers.
+        """
+        written = []
+        for line in lines:
+            if line[0] != "/":
+                written.append(line)
+                self.lines.append(self._origin)
+            elif line.startswith(ORIGIN_MARKER):
+                _, fname, line_no, function = line.split(" ")
+                file = self._file_indices.setdefault(fname, len(self.files))
+                if file == len(self.files):
+                    self.files.append(fname)
+                index = self._function_indices.setdefault(function, len(self.functions))
+                if index == len(self.functions):
+                    self.functions.append(function)
+                self._origin = len(self.origins)
+                self.origins.append((file, index, int(line_no)))
+            elif keep_comments:
+                written.append(line)
+                self.lines.append(self._origin)
+        return written
+
+    def origin(self, asm_line: int) -> tuple[str, str, int] | None:
+        """Return the VM file, function and line of a 1-based line of the
+        assembly file, or None if it does not come from a VM command."""
+        origin = self.lines[asm_line - 1]
+        if origin < 0:
+            return None
+        file, function, line_no = self.origins[origin]
+        return self.files[file], self.functions[function], line_no
+
+    def write(self, map_path) -> None:
+        """Write the map to a file."""
+        with open(map_path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "asm": self.asm_path,
+                    "files": self.files,
+                    "functions": self.functions,
+                    "origins": self.origins,
+                    "lines": self.lines,
+                },
+                f,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def read(cls, map_path) -> "SourceMap":
+        """Read a map written by `write`."""
+        with open(map_path, "rt", encoding="utf-8") as f:
+            stored = json.load(f)
+        source_map = cls(stored["asm"])
+        source_map.files = stored["files"]
+        source_map.functions = stored["functions"]
+        source_map.origins = [tuple(origin) for origin in stored["origins"]]
+        source_map.lines = stored["lines"]
+        return source_map
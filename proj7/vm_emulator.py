@@ -0,0 +1,353 @@
+"""Executes VM programs directly, without translating them to Hack.
+
+The commands of every file are laid out in a single list, in file order,
+and the labels, functions and static variables they name are resolved to
+list indices and RAM addresses once, when the program is loaded. Like the
+assembler's JIT, the list is split into blocks: runs of commands that start at a label, a function
+or the command after a jump, call or return. A block follows `goto` and
+`call` commands into their targets, whose index is known, and ends at the
+first `if-goto` or `return`, at a jump back into itself or at a label it
+did not jump to. Each block is compiled on first use into a Python
+function in which SP is a local variable, the values pushed and popped
+within the block are Python variables and the stack offsets of its
+commands are constants.
+
+RAM has the layout of the translated program: the SP, LCL, ARG, THIS and
+THAT pointers at 0 to 4, temp at 5 to 12, static variables from 16 in the
+order the assembler allocates them, i.e. of first reference, and the stack
+from 256. Words are unsigned 16-bit ints and comparisons subtract in 16
+bits as the translated code does, so a RAM dump matches that of the
+translated program, except for R13 to R15, which the translated code uses
+as scratch registers, and for return addresses, which are indices in the
+command list here rather than ROM addresses.
+"""
+
+from array import array
+from call_graph import ENTRY_POINT
+from command_type import CommandType
+from parser import Command
+
+RAM_SIZE = 32768
+"""Number of 16-bit words of RAM, as on the Hack computer."""
+STACK_BASE = 256
+STATIC_BASE = 16
+
+_MAX_BLOCK_LENGTH = 256
+"""Most commands compiled into a single block."""
+_SEGMENT_POINTERS = {"local": 1, "argument": 2, "this": 3, "that": 4}
+_REGISTER_BASES = {"temp": 5, "pointer": 3}
+_OPERATIONS = {
+    "add": "({x} + {y}) & 0xFFFF",
+    "sub": "({x} - {y}) & 0xFFFF",
+    "and": "{x} & {y}",
+    "or": "{x} | {y}",
+    "eq": "0xFFFF if {x} == {y} else 0",
+    "gt": "0xFFFF if 0 < ({x} - {y}) & 0xFFFF < 0x8000 else 0",
+    "lt": "0xFFFF if ({x} - {y}) & 0xFFFF >= 0x8000 else 0",
+    "neg": "-{x} & 0xFFFF",
+    "not": "{x} ^ 0xFFFF",
+}
+"""Python expressions computing each arithmetic command from its operands."""
+_TRANSFERS = {
+    CommandType.C_GOTO,
+    CommandType.C_IF,
+    CommandType.C_CALL,
+    CommandType.C_RETURN,
+}
+"""Commands that end a block."""
+
+
+def _offset(depth: int) -> str:
+    """Return the expression of the address depth words above SP."""
+    if depth == 0:
+        return "sp"
+    return f"sp + {depth}" if depth > 0 else f"sp - {-depth}"
+
+
+class _BlockStack:
+    """The stack of a block being compiled.
+
+    The values that the block pushes are held in Python variables, and only
+    those left on the stack are written to RAM, at the end of the block.
+    """
+
+    def __init__(self) -> None:
+        self.body: list[str] = []
+        """The statements of the block."""
+        self.depth = 0
+        """Words pushed, less words popped, since the start of the block."""
+        self._held: list[str] = []
+        """Variables or constants holding the topmost values, which are not
+        in RAM yet."""
+        self._variables = 0
+
+    def push(self, value: str, constant: bool = False) -> None:
+        """Push the value of an expression, evaluated now unless constant."""
+        if not constant:
+            variable = f"v{self._variables}"
+            self._variables += 1
+            self.body.append(f"{variable} = {value}")
+            value = variable
+        self._held.append(value)
+        self.depth += 1
+
+    def push_zeros(self, count: int) -> None:
+        """Push count zeros to RAM, where they can be addressed."""
+        self.flush()
+        self.body += (f"ram[{_offset(depth)}] = 0" for depth in range(count))
+        self.depth += count
+
+    def pop(self) -> str:
+        """Pop a value and return an expression of it, to use at once."""
+        self.depth -= 1
+        if self._held:
+            return self._held.pop()
+        return f"ram[{_offset(self.depth)}]"
+
+    def flush(self) -> None:
+        """Write the held values to RAM and bring SP up to date."""
+        below = self.depth - len(self._held)
+        for i, value in enumerate(self._held):
+            self.body.append(f"ram[{_offset(below + i)}] = {value}")
+        self._held.clear()
+        if self.depth:
+            self.body.append(f"sp += {self.depth}")
+        self.depth = 0
+
+
+class VMEmulator:
+    """A computer that executes VM commands, with the RAM of a Hack computer.
+
+    A program has halted once it runs past its last command, e.g. by
+    returning from `Sys.init`, or reaches the conventional infinite loop
+    `label L`, `goto L`, after which `run` executes no more commands.
+    """
+
+    def __init__(self, programs: dict[str, list[Command]]) -> None:
+        """Load a program and reset the computer.
+
+        Args:
+            programs: The commands of each file, keyed by file name, in the
+                order they are translated, see `VMTranslator.parse_source`.
+
+        Raises:
+            ValueError: A label or function is not defined.
+        """
+        self.commands: list[Command] = []
+        """The commands of every file, in order."""
+        self.statics: dict[str, int] = {}
+        """RAM address of each static variable, as `File.index`."""
+        self._operands: list[int] = []
+        """Resolved operand of each command: the index of the target of a
+        jump or call, or the RAM address of a static variable."""
+        self._blocks: dict[int, tuple] = {}
+        """Compiled blocks, by the index of their first command."""
+        self._load(programs)
+        self.ram = array("H", bytes(2 * RAM_SIZE))
+        self.reset()
+
+    def _load(self, programs: dict[str, list[Command]]) -> None:
+        """Lay out the commands and resolve their operands."""
+        targets: dict[str, int] = {}
+        """Index of each function and label, as `function$label`."""
+        pending: list[tuple[int, str, str]] = []
+        """Index, file name and target of each jump and call."""
+        function = ""
+        for fname, commands in programs.items():
+            for command in commands:
+                index = len(self.commands)
+                operand = -1
+                match command.command_type:
+                    case CommandType.C_FUNCTION:
+                        function = command.arg_1
+                        targets[function] = index
+                    case CommandType.C_LABEL:
+                        targets[f"{function}${command.arg_1}"] = index
+                    case CommandType.C_GOTO | CommandType.C_IF:
+                        pending.append((index, fname, f"{function}${command.arg_1}"))
+                    case CommandType.C_CALL:
+                        pending.append((index, fname, command.arg_1))
+                    case CommandType.C_PUSH | CommandType.C_POP:
+                        if command.arg_1 == "static":
+                            operand = self.statics.setdefault(
+                                f"{fname}.{command.arg_2}",
+                                STATIC_BASE + len(self.statics),
+                            )
+                self.commands.append(command)
+                self._operands.append(operand)
+        for index, fname, target in pending:
+            if target not in targets:
+                line_no = self.commands[index].line_no
+                raise ValueError(f"{fname}: line {line_no}: {target} is not defined")
+            self._operands[index] = targets[target]
+        self._entry = targets.get(ENTRY_POINT)
+
+    def reset(self) -> None:
+        """Zero the RAM and start the program over.
+
+        If the program defines `Sys.init`, it is called as the bootstrap
+        code of the translated program does. Otherwise execution starts
+        at the first command with an empty stack.
+        """
+        ram = self.ram
+        ram[:] = array("H", bytes(2 * RAM_SIZE))
+        ram[0] = STACK_BASE
+        self.pc = 0
+        if self._entry is not None:
+            # call Sys.init 0, returning past the last command
+            ram[STACK_BASE] = len(self.commands)
+            ram[0] = ram[1] = STACK_BASE + 5
+            ram[2] = STACK_BASE
+            self.pc = self._entry
+        self.commands_executed = 0
+        """Total number of commands executed since the last reset."""
+        self.halted = False
+
+    def block_source(self, start: int) -> tuple[str, int, int]:
+        """Generate Python source for the block starting at start.
+
+        The source defines `block(ram, sp)`, which executes the block and
+        returns the new SP and the index of the next command.
+
+        Returns:
+            tuple: The source, the number of commands the block executes and
+                the index that the block jumps to if it is a halt loop, or -1.
+        """
+        stack = _BlockStack()
+        halt = -1
+        index, length, visited = start, 0, {start}
+        command_type = None
+        while index < len(self.commands) and length < _MAX_BLOCK_LENGTH:
+            command, operand = self.commands[index], self._operands[index]
+            command_type = command.command_type
+            if index not in visited and command_type in (
+                CommandType.C_LABEL,
+                CommandType.C_FUNCTION,
+            ):
+                break
+            index += 1
+            length += 1
+            if command_type is CommandType.C_PUSH:
+                value = self._segment_word(command.arg_1, command.arg_2, operand)
+                stack.push(value, command.arg_1 == "constant")
+            elif command_type is CommandType.C_POP:
+                address = self._segment_word(command.arg_1, command.arg_2, operand)
+                stack.body.append(f"{address} = {stack.pop()}")
+            elif command_type is CommandType.C_ARITHMETIC:
+                y = stack.pop()
+                if command.arg_1 in ("neg", "not"):
+                    stack.push(_OPERATIONS[command.arg_1].format(x=y))
+                else:
+                    x = stack.pop()
+                    stack.push(_OPERATIONS[command.arg_1].format(x=x, y=y))
+            elif command_type is CommandType.C_FUNCTION:
+                stack.push_zeros(command.arg_2)
+            elif command_type is not CommandType.C_LABEL:
+                if command_type in (CommandType.C_GOTO, CommandType.C_CALL):
+                    if operand not in visited:
+                        # Follow the jump, leaving out its return statement
+                        transfer = self._transfer_source(command, operand, index, stack)
+                        stack.body += transfer[:-1]
+                        index = operand
+                        visited.add(index)
+                        command_type = None
+                        continue
+                    if operand == start and length == 2:
+                        halt = start
+                stack.body += self._transfer_source(command, operand, index, stack)
+                break
+            command_type = None
+        if command_type not in _TRANSFERS:
+            stack.flush()
+            stack.body.append(f"return sp, {index}")
+        source = "def block(ram, sp):\n" + "".join(f"    {s}\n" for s in stack.body)
+        return source, length, halt
+
+    def _segment_word(self, segment: str, index: int, static_address: int) -> str:
+        """Return the expression of the RAM word of a segment entry, or of
+        the value of a constant."""
+        if segment == "constant":
+            return f"{index}"
+        if segment == "static":
+            return f"ram[{static_address}]"
+        if segment in _REGISTER_BASES:
+            return f"ram[{_REGISTER_BASES[segment] + index}]"
+        pointer = _SEGMENT_POINTERS[segment]
+        if index == 0:
+            return f"ram[ram[{pointer}] & 0x7FFF]"
+        return f"ram[(ram[{pointer}] + {index}) & 0x7FFF]"
+
+    def _transfer_source(
+        self, command: Command, target: int, next_index: int, stack: "_BlockStack"
+    ) -> list[str]:
+        """Return the statements of a command that transfers control, after
+        those that write the stack of the block to RAM."""
+        match command.command_type:
+            case CommandType.C_GOTO:
+                stack.flush()
+                return [f"return sp, {target}"]
+            case CommandType.C_IF:
+                # Take the condition before SP moves
+                stack.body.append(f"c = {stack.pop()}")
+                stack.flush()
+                return [f"return sp, {target} if c else {next_index}"]
+            case CommandType.C_CALL:
+                stack.flush()
+                return [
+                    f"ram[sp] = {next_index}",
+                    *(f"ram[sp + {i}] = ram[{i}]" for i in range(1, 5)),
+                    "sp += 5",
+                    f"ram[2] = (sp - {5 + command.arg_2}) & 0xFFFF",
+                    "ram[1] = sp",
+                    f"return sp, {target}",
+                ]
+        # Return, in the order of the translated code
+        stack.flush()
+        return [
+            "frame = ram[1]",
+            "ret = ram[(frame - 5) & 0x7FFF]",
+            "ram[ram[2] & 0x7FFF] = ram[sp - 1]",
+            "sp = (ram[2] + 1) & 0xFFFF",
+            *(f"ram[{i}] = ram[(frame - {5 - i}) & 0x7FFF]" for i in range(4, 0, -1)),
+            "return sp, ret",
+        ]
+
+    def compile_block(self, start: int) -> tuple:
+        """Compile the block starting at start.
+
+        Returns:
+            tuple: `(function, length, halt)`, see `block_source`.
+        """
+        source, length, halt = self.block_source(start)
+        namespace: dict = {}
+        exec(compile(source, f"<vm block {start}>", "exec"), namespace)
+        return namespace["block"], length, halt
+
+    def run(self, max_commands: int) -> int:
+        """Execute commands until the program halts or at least max_commands
+        have been executed, which may be up to a block more.
+
+        Returns:
+            int: The number of commands executed.
+        """
+        if self.halted:
+            return 0
+        ram, blocks, end = self.ram, self._blocks, len(self.commands)
+        sp, pc = ram[0], self.pc
+        executed = 0
+        while executed < max_commands:
+            if pc == end:
+                self.halted = True
+                break
+            block = blocks.get(pc)
+            if block is None:
+                block = blocks[pc] = self.compile_block(pc)
+            function, length, halt = block
+            sp, pc = function(ram, sp)
+            executed += length
+            if pc == halt:
+                self.halted = True
+                break
+        ram[0], self.pc = sp, pc
+        self.commands_executed += executed
+        return executed
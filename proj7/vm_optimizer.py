@@ -0,0 +1,189 @@
+"""Optimizer for parsed VM commands, run before `CodeWriter`.
+
+The commands of a file go through a peephole pass like the one in
+`peephole`: each command is appended to the output, whose tail is then
+rewritten for as long as it matches one of the rules below. Only labels can
+be jumped to, and no rule matches across a label.
+"""
+
+from collections import Counter
+from command_type import CommandType
+from parser import Command
+
+RULES = ("fold", "push-pop", "unary", "branch", "jump", "dead")
+"""Names of the rules.
+
+- fold: arithmetic on constants is computed, and adding, subtracting or
+  or-ing 0 and and-ing -1 are removed. Constants outside 0..32767 are
+  written as `push constant c` followed by `not`.
+- push-pop: `push s i` followed by `pop s i`.
+- unary: `not` followed by `not`, and `neg` followed by `neg`.
+- branch: `if-goto` on a constant becomes a `goto` or is removed, and `eq`,
+  `not`, `if-goto` becomes `sub`, `if-goto`.
+- jump: `goto` to the label that follows it.
+- dead: commands following a `goto` or `return` before the next label.
+"""
+
+_MAX_CONSTANT = 32767
+_WORD = 0xFFFF
+_TRUE = _WORD
+_BINARY = {
+    "add": lambda x, y: x + y,
+    "sub": lambda x, y: x - y,
+    "and": lambda x, y: x & y,
+    "or": lambda x, y: x | y,
+    "eq": lambda x, y: _TRUE if x == y else 0,
+    "gt": lambda x, y: _TRUE if _signed(x) > _signed(y) else 0,
+    "lt": lambda x, y: _TRUE if _signed(x) < _signed(y) else 0,
+}
+_UNARY = {"neg": lambda y: -y, "not": lambda y: ~y}
+_IDENTITY = {"add": 0, "sub": 0, "or": 0, "and": _WORD}
+"""The constant that leaves the other operand of each command unchanged."""
+_JUMPS = (CommandType.C_GOTO, CommandType.C_RETURN)
+_ENTRIES = (CommandType.C_LABEL, CommandType.C_FUNCTION)
+
+
+def optimize(
+    commands: list[Command], name: str = ""
+) -> tuple[list[Command], dict[str, Counter[str]]]:
+    """Simplify the commands of a VM file.
+
+    Args:
+        commands: The commands of the file.
+        name: Name under which commands outside of functions are counted.
+
+    Returns:
+        tuple: The optimized commands, and the number of commands removed by
+            each rule in each function.
+    """
+    out: list[Command] = []
+    removed: dict[str, Counter[str]] = {}
+    function = name
+    for command in commands:
+        if command.command_type is CommandType.C_FUNCTION:
+            function = command.arg_1
+        if (
+            out
+            and out[-1].command_type in _JUMPS
+            and command.command_type not in _ENTRIES
+        ):
+            removed.setdefault(function, Counter())["dead"] += 1
+            continue
+        out.append(command)
+        while rule := _rewrite(out):
+            removed.setdefault(function, Counter())[rule[0]] += rule[1]
+    return out, removed
+
+
+def _signed(word: int) -> int:
+    """Return the value of a 16-bit two's complement word."""
+    return word - 0x10000 if word & 0x8000 else word
+
+
+def _is_arithmetic(command: Command, name: str) -> bool:
+    """Return whether command is the arithmetic-logical command name."""
+    return (
+        command.command_type is CommandType.C_ARITHMETIC and command.arg_1 == name
+    )
+
+
+def _push_constant(value: int, line_no: int) -> list[Command]:
+    """Return the shortest commands that push a 16-bit value."""
+    value &= _WORD
+    if value <= _MAX_CONSTANT:
+        return [Command(CommandType.C_PUSH, "constant", value, line_no)]
+    return [
+        Command(CommandType.C_PUSH, "constant", ~value & _WORD, line_no),
+        Command(CommandType.C_ARITHMETIC, "not", None, line_no),
+    ]
+
+
+def _constant(out: list[Command], end: int) -> tuple[int, int] | None:
+    """Return the value pushed by the constant ending before out[end].
+
+    Returns:
+        tuple: The value as a 16-bit word and the number of commands that
+            push it, or None if out[end - 1] does not end a constant.
+    """
+    if end < 1:
+        return None
+    last = out[end - 1]
+    if last.command_type is CommandType.C_PUSH and last.arg_1 == "constant":
+        return last.arg_2 & _WORD, 1
+    if _is_arithmetic(last, "not") and end >= 2:
+        previous = out[end - 2]
+        if (
+            previous.command_type is CommandType.C_PUSH
+            and previous.arg_1 == "constant"
+        ):
+            return ~previous.arg_2 & _WORD, 2
+    return None
+
+
+def _replace(out: list[Command], count: int, commands: list[Command]) -> int:
+    """Replace the last count commands of out and return how many fewer there are."""
+    out[-count:] = commands
+    return count - len(commands)
+
+
+def _rewrite(out: list[Command]) -> tuple[str, int] | None:
+    """Rewrite the end of out if it matches a rule.
+
+    Returns:
+        tuple: The name of the rule and the number of commands it removed,
+            or None if no rule matched.
+    """
+    last = out[-1]
+    line_no = last.line_no
+    if last.command_type is CommandType.C_ARITHMETIC:
+        y = _constant(out, len(out) - 1)
+        if last.arg_1 in _UNARY:
+            if len(out) >= 2 and _is_arithmetic(out[-2], last.arg_1):
+                return "unary", _replace(out, 2, [])
+            if y is not None:
+                folded = _push_constant(_UNARY[last.arg_1](y[0]), line_no)
+                if len(folded) < y[1] + 1:
+                    return "fold", _replace(out, y[1] + 1, folded)
+            return None
+        if y is None:
+            return None
+        x = _constant(out, len(out) - 1 - y[1])
+        if x is not None:
+            folded = _push_constant(_BINARY[last.arg_1](x[0], y[0]), line_no)
+            return "fold", _replace(out, x[1] + y[1] + 1, folded)
+        if _IDENTITY.get(last.arg_1) == y[0]:
+            return "fold", _replace(out, y[1] + 1, [])
+        return None
+
+    if last.command_type is CommandType.C_POP and len(out) >= 2:
+        previous = out[-2]
+        if (
+            previous.command_type is CommandType.C_PUSH
+            and (previous.arg_1, previous.arg_2) == (last.arg_1, last.arg_2)
+        ):
+            return "push-pop", _replace(out, 2, [])
+        return None
+
+    if last.command_type is CommandType.C_IF:
+        condition = _constant(out, len(out) - 1)
+        if condition is not None:
+            goto = Command(CommandType.C_GOTO, last.arg_1, None, line_no)
+            taken = [goto] if condition[0] else []
+            return "branch", _replace(out, condition[1] + 1, taken)
+        if (
+            len(out) >= 3
+            and _is_arithmetic(out[-3], "eq")
+            and _is_arithmetic(out[-2], "not")
+        ):
+            sub = Command(CommandType.C_ARITHMETIC, "sub", None, out[-3].line_no)
+            return "branch", _replace(out, 3, [sub, last])
+        return None
+
+    if last.command_type is CommandType.C_LABEL and len(out) >= 2:
+        previous = out[-2]
+        if (
+            previous.command_type is CommandType.C_GOTO
+            and previous.arg_1 == last.arg_1
+        ):
+            return "jump", _replace(out, 2, [last])
+    return None